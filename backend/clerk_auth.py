@@ -1,17 +1,41 @@
 # clerk_auth.py
 import requests
 import jwt
-from jwt import PyJWKClient
+from jwt import PyJWKClientError, PyJWKSet
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 import os
 from django.contrib.auth import get_user_model
+from backend import outbound
 
 # Get the Clerk JWKS URL from environment or use a placeholder
 CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", "https://clerk.dev/.well-known/jwks.json")
 
 User = get_user_model()
 
+_jwks = None
+
+
+def get_signing_key(token):
+    # Clerk's JWKS is fetched once per process through the pooled outbound
+    # session, and again only when a token names a key it doesn't have.
+    global _jwks
+    kid = jwt.get_unverified_header(token).get("kid")
+    key = _find_key(_jwks, kid)
+    if key is None:
+        response = outbound.session("clerk").get(CLERK_JWKS_URL)
+        response.raise_for_status()
+        _jwks = PyJWKSet.from_dict(response.json())
+        key = _find_key(_jwks, kid)
+    if key is None:
+        raise PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+    return key
+
+
+def _find_key(jwks, kid):
+    return next((key for key in jwks.keys if key.key_id == kid), None) if jwks is not None else None
+
+
 class ClerkAuthentication(BaseAuthentication):
     def authenticate(self, request):
         auth_header = request.headers.get("Authorization", "")
@@ -26,8 +50,7 @@ class ClerkAuthentication(BaseAuthentication):
 
         try:
             print(f"Using JWKS URL: {CLERK_JWKS_URL}")  # Debug log
-            jwks_client = PyJWKClient(CLERK_JWKS_URL)
-            signing_key = jwks_client.get_signing_key_from_jwt(token)
+            signing_key = get_signing_key(token)
             decoded = jwt.decode(token, signing_key.key, algorithms=["RS256"])
             request.clerk_user_id = decoded["sub"]  # Store Clerk user ID
             
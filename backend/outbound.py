@@ -0,0 +1,213 @@
+"""
+Shared outbound HTTP for the third-party APIs the store calls (Stripe,
+Shippo, Clerk).
+
+Each upstream gets one long-lived requests.Session, from session(name),
+with its own keep-alive connection pool. Every request it sends, whether
+made through request() or prepared and passed to send() as the Shippo SDK
+does:
+
+* is bounded by the upstream's (connect, read) timeouts, whatever the
+  calling SDK asks for;
+* is retried a bounded number of times with full-jitter exponential
+  backoff, after connection errors, timeouts and 429/502/503/504
+  responses. Only idempotent methods are retried, plus requests that
+  carry an Idempotency-Key. Attempts and backoff together stay within the
+  upstream's `deadline`: a retry is only made if it could run to its full
+  timeout before then;
+* goes through a circuit breaker. After `failure_threshold` consecutive
+  failures, calls fail fast with CircuitOpenError for `reset_timeout`
+  seconds, then a single trial call decides whether to close again;
+* is timed into a per-upstream latency histogram, exported in Prometheus
+  text format by render_metrics().
+
+Settings: OUTBOUND_HTTP maps upstream names to overrides of DEFAULTS. The
+sessions are plain requests sessions, so tests point them at local stub
+servers.
+"""
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+DEFAULTS = {
+    'connect_timeout': 3.05,
+    'read_timeout': 20,
+    'retries': 2,
+    'backoff': 0.2,
+    'max_backoff': 2,
+    'pool_size': 10,
+    'failure_threshold': 5,
+    'reset_timeout': 30,
+    'deadline': 25,
+}
+
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without touching the network while an upstream's breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'open' if self.clock() - self.opened_at < self.reset_timeout else 'half-open'
+
+    def before_call(self, name):
+        with self.lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self.trial_running):
+                raise CircuitOpenError(f"Circuit for {name} is open")
+            if state == 'half-open':
+                self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def release_trial(self):
+        # The call ended without telling us anything about the upstream.
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[index] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(zip(self.buckets, self.counts)), self.count, self.total
+
+
+class UpstreamSession(requests.Session):
+    def __init__(self, name, config):
+        super().__init__()
+        self.name = name
+        self.config = config
+        self.timeout = (config['connect_timeout'], config['read_timeout'])
+        self.breaker = CircuitBreaker(config['failure_threshold'], config['reset_timeout'])
+        self.latency = LatencyHistogram()
+        adapter = HTTPAdapter(pool_connections=config['pool_size'], pool_maxsize=config['pool_size'], max_retries=0)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def backoff(self, attempt):
+        ceiling = min(self.config['max_backoff'], self.config['backoff'] * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def send(self, request, **kwargs):
+        # Session.request() ends up here too, so this is the one place the policy lives.
+        connect, read = self.timeout
+        # Not even a single attempt may outlast the deadline.
+        read = min(read, self.config['deadline'] - connect)
+        kwargs['timeout'] = (connect, read)
+        deadline = time.monotonic() + self.config['deadline']
+        retryable = request.method.upper() in IDEMPOTENT_METHODS or 'Idempotency-Key' in request.headers
+        attempts = self.config['retries'] + 1 if retryable else 1
+
+        for attempt in range(attempts):
+            self.breaker.before_call(self.name)
+            started = time.perf_counter()
+            try:
+                response, error = super().send(request, **kwargs), None
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                self.latency.observe(time.perf_counter() - started)
+                self.breaker.record_failure()
+                response, error = None, exc
+            except Exception:
+                # Not the upstream's fault: free a half-open trial without counting a failure.
+                self.breaker.release_trial()
+                raise
+            else:
+                self.latency.observe(time.perf_counter() - started)
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+            pause = self.backoff(attempt)
+            # Another try only if it could run to its full timeout before the deadline.
+            if attempt == attempts - 1 or time.monotonic() + pause + connect + read > deadline:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            time.sleep(pause)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def session(name):
+    """The shared session for upstream `name`, built from settings on first use."""
+    with _sessions_lock:
+        if name not in _sessions:
+            config = {**DEFAULTS, **getattr(settings, 'OUTBOUND_HTTP', {}).get(name, {})}
+            _sessions[name] = UpstreamSession(name, config)
+        return _sessions[name]
+
+
+def render_metrics():
+    """Latency histograms and breaker states in Prometheus text format."""
+    with _sessions_lock:
+        upstreams = sorted(_sessions.items())
+    lines = [
+        "# HELP outbound_request_duration_seconds Outbound HTTP request latency per upstream.",
+        "# TYPE outbound_request_duration_seconds histogram",
+    ]
+    for name, upstream in upstreams:
+        buckets, count, total = upstream.latency.snapshot()
+        for bound, bucket_count in buckets:
+            lines.append(f'outbound_request_duration_seconds_bucket{{upstream="{name}",le="{bound}"}} {bucket_count}')
+        lines.append(f'outbound_request_duration_seconds_bucket{{upstream="{name}",le="+Inf"}} {count}')
+        lines.append(f'outbound_request_duration_seconds_sum{{upstream="{name}"}} {total}')
+        lines.append(f'outbound_request_duration_seconds_count{{upstream="{name}"}} {count}')
+    lines += [
+        "# HELP outbound_circuit_open Whether the upstream's circuit breaker is failing fast (1) or not (0).",
+        "# TYPE outbound_circuit_open gauge",
+    ]
+    for name, upstream in upstreams:
+        lines.append(f'outbound_circuit_open{{upstream="{name}"}} {int(upstream.breaker.state == "open")}')
+    return "\n".join(lines) + "\n"
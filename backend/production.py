@@ -48,6 +48,12 @@ CORS_ALLOWED_ORIGINS = [
     "https://buddhabashafrontend.vercel.app",
 ]
 
+# Cache - every gunicorn worker must share it, or each serves its own
+# catalog snapshot and misses the others' idempotency keys
+if local_cache:
+    print("WARNING: CACHE_BACKEND not set in production; each worker keeps its own cache.")
+    print("Set CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and CACHE_LOCATION=redis://...")
+
 # Database connection pooling (if using PostgreSQL)
 DATABASES = {
     "default": {
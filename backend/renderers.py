@@ -0,0 +1,66 @@
+# renderers.py
+"""
+JSON renderer/parser pair for the REST API.
+
+Uses orjson when it is installed: it serializes straight to bytes, with no
+intermediate str and no per-object encoder callbacks for dicts, lists,
+datetimes and UUIDs. Without orjson both classes behave exactly like
+DRF's stdlib-based JSONRenderer/JSONParser. Decimals are written as strings
+on both paths so prices and totals never lose precision.
+"""
+import decimal
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised when orjson is absent
+    orjson = None
+
+
+class StoreJSONEncoder(JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+_encoder = StoreJSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    encoder_class = StoreJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        # Pretty-printing (browsable API, ?indent=) and ASCII-only output are
+        # rare and orjson can't match them exactly; leave those to DRF.
+        if orjson is None or data is None or indent is not None or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=_encoder.default,
+            option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+        )
+        # Same JavaScript-safety escaping as DRF's renderer.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -46,8 +46,21 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "backend.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "backend.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
+# Default page size for the cursor-paginated store endpoints; clients can
+# override per request with ?page_size= (capped at 100).
+STORE_PAGE_SIZE = int(os.getenv("STORE_PAGE_SIZE", "24"))
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -69,6 +82,7 @@ MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",  
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # Add whitenoise here
+    "store.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -131,6 +145,81 @@ else:
     }
 
 
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache with
+# CACHE_LOCATION=redis://...) in production so every worker sees the same
+# catalog snapshot and idempotency keys.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "buddhabasha"),
+    }
+}
+local_cache = CACHES["default"]["BACKEND"].endswith("LocMemCache")
+if local_cache:
+    # The default 300-entry cap is smaller than the catalog.
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": 10000}
+
+# Pre-serialized product JSON (store/catalog.py). Entries are rebuilt from
+# model signals; the timeout is only a backstop for bulk .update() calls
+# that bypass them, and for local-memory caches, where a signal only clears
+# the worker that handled the write. There it is kept short.
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", "60" if local_cache else "86400"))
+
+# Per-variant stock levels served by /store/stock/. Variant saves clear
+# their entry; the short TTL covers bulk writes that skip signals.
+STOCK_CACHE_TIMEOUT = int(os.getenv("STOCK_CACHE_TIMEOUT", "5"))
+
+# How long checkout holds stock for a buyer (store/reservations.py). Also the
+# Stripe session lifetime, which Stripe only accepts between 30 minutes and
+# 24 hours, so keep it clear of the lower bound.
+STOCK_HOLD_MINUTES = int(os.getenv("STOCK_HOLD_MINUTES", "35"))
+
+# Seconds the app server gives a request before killing its worker.
+REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "30"))
+
+# Idempotency-Key replay for checkout (store/idempotency.py). Stripe keeps
+# its own idempotency keys for 24 hours; ours last as long. An in-flight
+# claim outlives any request by a little, so a killed request doesn't
+# block its key.
+IDEMPOTENCY_CACHE_ALIAS = CATALOG_CACHE_ALIAS
+IDEMPOTENCY_TTL = 86400
+IDEMPOTENCY_WAIT_SECONDS = 10
+IDEMPOTENCY_PENDING_TTL = IDEMPOTENCY_WAIT_SECONDS + REQUEST_TIMEOUT
+
+# Background jobs (store/jobs.py, run by `manage.py run_worker`). A failed
+# job is retried after JOB_RETRY_BACKOFF seconds, doubling up to
+# JOB_MAX_BACKOFF, and parked as dead after JOB_MAX_ATTEMPTS tries. A job
+# whose worker died goes back on the queue when its lease runs out.
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "8"))
+JOB_RETRY_BACKOFF = 30
+JOB_MAX_BACKOFF = 3600
+JOB_LEASE_SECONDS = 600
+
+# Outbound HTTP per upstream (backend/outbound.py): timeouts in seconds,
+# retry and circuit-breaker limits. Unset keys use outbound.DEFAULTS.
+# `deadline` bounds one call, retries included, and leaves the request
+# time to answer before REQUEST_TIMEOUT.
+OUTBOUND_HTTP = {
+    "stripe": {"connect_timeout": 3.05, "read_timeout": 20, "deadline": REQUEST_TIMEOUT - 5},
+    "shippo": {"connect_timeout": 3.05, "read_timeout": 30, "deadline": REQUEST_TIMEOUT - 5},
+    "clerk": {"connect_timeout": 2, "read_timeout": 5, "retries": 1, "deadline": 10},
+}
+
+# `manage.py purge_carts` deletes carts untouched for this many days.
+CART_IDLE_DAYS = int(os.getenv("CART_IDLE_DAYS", "30"))
+
+# API response compression (store.middleware.CompressionMiddleware). Brotli
+# is used when the brotli package is installed, gzip otherwise.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_BROTLI_QUALITY = 5
+COMPRESSION_CACHE_ALIAS = CATALOG_CACHE_ALIAS
+COMPRESSION_CACHE_TIMEOUT = 3600
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
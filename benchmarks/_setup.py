@@ -0,0 +1,60 @@
+"""
+Shared bootstrap for the benchmark scripts: configure Django against a
+throwaway test database and tear it down afterwards.
+
+    python -m benchmarks.serializers
+"""
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+
+
+@contextmanager
+def benchmark_database():
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def seed_catalog(products, variants_per_product=3, images_per_product=2):
+    import cloudinary
+    from store.models import Category, Product, ProductImage, ProductVariant
+
+    cloudinary.config(cloud_name="bench")
+    categories = Category.objects.bulk_create(
+        [Category(name=f"Category {i}", slug=f"category-{i}") for i in range(10)]
+    )
+    created = Product.objects.bulk_create([
+        Product(
+            name=f"Product {i}",
+            description="Handmade sterling silver piece " * 4,
+            image=f"buddhabasha/product_{i}.jpg",
+            price=f"{10 + i % 90}.99",
+            category=categories[i % len(categories)],
+        )
+        for i in range(products)
+    ])
+    ProductVariant.objects.bulk_create([
+        ProductVariant(product=product, size=str(5 + v), stock=v)
+        for product in created for v in range(variants_per_product)
+    ])
+    ProductImage.objects.bulk_create([
+        ProductImage(product=product, image=f"buddhabasha/extra_{product.pk}_{i}.jpg", alt_text=product.name)
+        for product in created for i in range(images_per_product)
+    ])
+    return created
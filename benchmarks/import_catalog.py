@@ -0,0 +1,61 @@
+"""
+Throughput of `manage.py import_catalog` on a generated CSV file: one cold
+import (inserts) and one re-import of the same file (all upserts).
+
+    python -m benchmarks.import_catalog [--rows 50000] [--batch-size 1000]
+"""
+import argparse
+import csv
+import io
+import os
+import tempfile
+import time
+
+from benchmarks._setup import benchmark_database
+
+
+def write_csv(path, rows, sizes=("5", "6", "7", "8", "9")):
+    from store.management.commands.import_catalog import FIELDS
+
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.DictWriter(handle, fieldnames=FIELDS)
+        writer.writeheader()
+        for i in range(rows):
+            product = i // len(sizes)
+            writer.writerow({
+                "product_sku": f"SKU-{product:06d}",
+                "name": f"Product {product}",
+                "description": "Handmade sterling silver piece",
+                "price": f"{10 + product % 90}.99",
+                "image": f"buddhabasha/product_{product}.jpg",
+                "category_slug": f"category-{product % 20}",
+                "category_name": f"Category {product % 20}",
+                "size": sizes[i % len(sizes)],
+                "stock": i % 13,
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import_catalog throughput")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        from django.core.management import call_command
+
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        try:
+            write_csv(path, args.rows)
+            for label in ("insert", "upsert"):
+                start = time.perf_counter()
+                call_command("import_catalog", path, "--batch-size", str(args.batch_size), stdout=io.StringIO())
+                seconds = time.perf_counter() - start
+                print(f"{label:<7} {args.rows} rows in {seconds:.1f}s ({args.rows / seconds:,.0f} rows/s)")
+        finally:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Render time and peak memory of DRF's JSONRenderer vs backend.renderers.FastJSONRenderer
+on a 5k-product list payload shaped like ProductSerializer output.
+
+    python -m benchmarks.json_renderer [--products 5000] [--repeat 5]
+"""
+import argparse
+import time
+import tracemalloc
+from decimal import Decimal
+
+from benchmarks import _setup  # noqa: F401  (configures Django)
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from backend import renderers
+from backend.renderers import FastJSONRenderer
+
+
+def product_payload(count):
+    now = timezone.now()
+    return {
+        "next": "https://example.com/store/products/?cursor=cD0yMDI1",
+        "previous": None,
+        "results": [
+            {
+                "id": i,
+                "category": {"id": i % 10, "name": f"Category {i % 10}", "slug": f"category-{i % 10}"},
+                "images": [{"id": i * 2 + n, "image": f"image/upload/buddhabasha/extra_{i}_{n}.jpg", "alt_text": ""} for n in range(2)],
+                "variants": [{"id": i * 3 + n, "size": str(5 + n), "stock": n, "product": i} for n in range(3)],
+                "image_url": f"https://res.cloudinary.com/demo/image/upload/buddhabasha/product_{i}.jpg",
+                "name": f"Product {i}",
+                "description": "Handmade sterling silver piece " * 4,
+                "image": f"image/upload/buddhabasha/product_{i}.jpg",
+                "price": Decimal(f"{10 + i % 90}.99"),
+                "created_at": now,
+                "updated_at": now,
+            }
+            for i in range(count)
+        ],
+    }
+
+
+def measure(renderer, data, repeat):
+    best = min(_timed(renderer, data) for _ in range(repeat))
+    tracemalloc.start()
+    body = renderer.render(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, len(body)
+
+
+def _timed(renderer, data):
+    start = time.perf_counter()
+    renderer.render(data)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON renderer benchmark")
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = product_payload(args.products)
+    cases = [("DRF JSONRenderer", JSONRenderer())]
+    if renderers.orjson is not None:
+        cases.append(("FastJSONRenderer", FastJSONRenderer()))
+    else:
+        print("orjson not installed; FastJSONRenderer would fall back to the stdlib path.")
+
+    print(f"{args.products} products")
+    print(f"{'renderer':<18} {'ms':>8} {'peak MiB':>9} {'MiB out':>8}")
+    for name, renderer in cases:
+        seconds, peak, size = measure(renderer, data, args.repeat)
+        print(f"{name:<18} {seconds * 1000:>8.1f} {peak / 2**20:>9.1f} {size / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
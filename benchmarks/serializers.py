@@ -0,0 +1,69 @@
+"""
+Compare DRF ModelSerializers with the compiled readers in
+store/fast_serializers.py, per 1k objects.
+
+    python -m benchmarks.serializers [--objects 1000] [--repeat 5]
+"""
+import argparse
+import time
+
+from benchmarks._setup import benchmark_database, seed_catalog
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--objects", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        from django.db.models import Prefetch
+        from django.test import RequestFactory
+        from store.fast_serializers import cart_item_reader, order_reader, product_reader
+        from store.models import Cart, CartItem, Order, OrderItem, Product, ProductVariant
+        from store.serializers import CartItemSerializer, OrderSerializer, ProductSerializer
+
+        seed_catalog(args.objects)
+        variants = list(ProductVariant.objects.all()[:args.objects])
+        cart = Cart.objects.create(clerk_user_id="bench")
+        CartItem.objects.bulk_create([CartItem(cart=cart, variant=v, quantity=1) for v in variants])
+        orders = Order.objects.bulk_create([
+            Order(clerk_user_id="bench", email="bench@example.com", subtotal="10.99") for _ in range(args.objects)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, variant=variants[i], quantity=1, price="10.99") for i, order in enumerate(orders)
+        ])
+
+        request = RequestFactory().get("/store/")
+        context = {"request": request}
+        # The querysets the views give DRF. A bare prefetch_related("items")
+        # on 1000 orders is also past SQLite's expression depth limit.
+        cases = [
+            ("products", Product.objects.for_catalog(), ProductSerializer, product_reader),
+            ("cart items", CartItem.objects.filter(cart=cart).with_products(), CartItemSerializer, cart_item_reader),
+            (
+                "orders",
+                Order.objects.prefetch_related(Prefetch("items", queryset=OrderItem.objects.with_products())),
+                OrderSerializer,
+                order_reader,
+            ),
+        ]
+        scale = 1000 / args.objects
+        print(f"{'endpoint':<12} {'DRF ms/1k':>10} {'fast ms/1k':>11} {'speedup':>8}")
+        for name, queryset, serializer_class, reader in cases:
+            slow = best_of(args.repeat, lambda: serializer_class(queryset.all(), many=True, context=context).data)
+            fast = best_of(args.repeat, lambda: reader.serialize(reader.values(queryset.all()), request))
+            print(f"{name:<12} {slow * 1000 * scale:>10.1f} {fast * 1000 * scale:>11.1f} {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,9 @@ import requests
 
 from .models import (
     Product, Category, Cart, CartItem, Order, OrderItem,
-    ProductImage, ProductVariant, UserProfile
+    ProductImage, ProductVariant, UserProfile, Job
 )
+from . import jobs
 
 # ---------- Global Admin Config ----------
 admin.site.site_header = "BuddhaBasha Admin"
@@ -94,4 +95,18 @@ class OrderAdmin(admin.ModelAdmin):
 
     def grand_total_display(self, obj):
         return f"${obj.grand_total():.2f}"
-    grand_total_display.short_description = "Total"
\ No newline at end of file
+    grand_total_display.short_description = "Total"
+
+# ---------- Job Admin ----------
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "attempts", "run_at", "updated_at")
+    list_filter = ("status", "kind")
+    search_fields = ("key",)
+    readonly_fields = ("kind", "key", "payload", "attempts", "last_error", "created_at", "updated_at")
+    actions = ["requeue"]
+
+    @admin.action(description="Requeue selected jobs")
+    def requeue(self, request, queryset):
+        count = jobs.requeue(queryset.exclude(status=Job.RUNNING))
+        messages.success(request, f"Requeued {count} job(s).")
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        import stripe
+        from backend import outbound
+        from store import fulfillment, signals  # noqa: F401
+
+        # Stripe calls share the pooled, timeout-bounded outbound session,
+        # which also does the retrying; the SDK's own retries would multiply it.
+        stripe.default_http_client = stripe.RequestsClient(session=outbound.session('stripe'))
+        stripe.max_network_retries = 0
@@ -0,0 +1,107 @@
+"""
+Cart bookkeeping shared by the cart views and middleware.
+
+Guest carts are keyed ``guest_<session_key>`` (see CartItemViewSet), signed-in
+carts by the Clerk ``sub``. When a guest signs in, ClerkUserMiddleware calls
+merge_guest_cart() once for the session so the lines they added before signing
+in follow them to their account.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from store.models import Cart, CartItem
+
+
+def guest_cart_id(session_key):
+    return f"guest_{session_key}"
+
+
+def touch_cart(cart_id):
+    """Mark the cart active; editing its lines doesn't save the Cart row itself."""
+    Cart.objects.filter(pk=cart_id).update(updated_at=timezone.now())
+
+
+def upsert_cart(user_id):
+    """
+    The cart for `user_id`, created if missing, in one
+    INSERT ... ON CONFLICT (clerk_user_id) DO UPDATE statement that also
+    marks it active. Concurrent callers all get the same row.
+    """
+    cart = Cart(clerk_user_id=user_id)
+    Cart.objects.bulk_create(
+        [cart],
+        update_conflicts=True,
+        unique_fields=['clerk_user_id'],
+        update_fields=['updated_at'],
+    )
+    if cart.pk is None:  # backend can't return ids from an upsert
+        cart = Cart.objects.get(clerk_user_id=user_id)
+    return cart
+
+
+def add_to_cart(cart_id, variant, quantity):
+    """
+    Add `quantity` of `variant` to the cart. An existing line is bumped with
+    one conditional F() update, so concurrent adds can't lose each other or
+    push it past stock. A new line is inserted and the unique
+    (cart, variant) constraint turns a racing insert into a retried update.
+
+    Returns False, changing nothing, when the line would exceed stock.
+    """
+    lines = CartItem.objects.filter(cart_id=cart_id, variant=variant)
+    for attempt in range(2):
+        if lines.filter(quantity__lte=variant.stock - quantity).update(quantity=F('quantity') + quantity):
+            return True
+        if quantity > variant.stock or lines.exists():
+            return False
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart_id=cart_id, variant=variant, quantity=quantity)
+            return True
+        except IntegrityError:
+            if attempt:
+                raise
+
+
+def merge_guest_cart(guest_id, user_id):
+    """
+    Move every line of the `guest_id` cart into the `user_id` cart and delete
+    the guest cart. Lines for the same variant are summed and capped at the
+    variant's stock. The merged lines are written with one upsert on
+    (cart, variant), all in one transaction.
+
+    Returns the user's cart, or None when there was no guest cart to merge.
+    """
+    if not guest_id or guest_id == user_id:
+        return None
+    with transaction.atomic():
+        guest = Cart.objects.select_for_update().filter(clerk_user_id=guest_id).first()
+        if guest is None:
+            return None
+        cart = Cart.objects.select_for_update().filter(clerk_user_id=user_id).first()
+        if cart is None:
+            # Nothing to combine with: the guest cart simply changes hands.
+            guest.clerk_user_id = user_id
+            guest.save(update_fields=['clerk_user_id', 'updated_at'])
+            return guest
+
+        lines = list(guest.items.values_list('variant_id', 'quantity', 'variant__stock'))
+        existing = dict(
+            cart.items.filter(variant_id__in=[variant_id for variant_id, _, _ in lines])
+            .values_list('variant_id', 'quantity')
+        )
+        merged = []
+        for variant_id, quantity, stock in lines:
+            quantity = min(existing.get(variant_id, 0) + quantity, stock)
+            if quantity:
+                merged.append(CartItem(cart=cart, variant_id=variant_id, quantity=quantity))
+        CartItem.objects.bulk_create(
+            merged,
+            update_conflicts=True,
+            unique_fields=['cart', 'variant'],
+            update_fields=['quantity'],
+        )
+        guest.delete()
+        touch_cart(cart.pk)
+    return cart
@@ -0,0 +1,199 @@
+"""
+Pre-serialized product JSON kept in the cache framework.
+
+Each product is stored as the exact bytes ProductSerializer and the API
+renderer would produce (built through store/fast_serializers.py), so
+ProductViewSet can answer list/retrieve by stitching cached fragments
+together instead of running serializers and Cloudinary URL building per
+request. Entries are invalidated and rebuilt per product from
+the signal handlers in store/signals.py.
+
+The catalog state (a version token plus the newest Product/ProductVariant
+change) is cached next to the snapshots and reset on every change; it backs
+the ETag and Last-Modified headers of the catalog endpoints. Short-lived
+per-variant stock levels for /store/stock/ and the Stripe price_data blocks
+StripeCheckoutView sends for each variant live here too.
+"""
+import hashlib
+import uuid
+from decimal import ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+
+from backend.renderers import FastJSONRenderer
+from store.models import Product, ProductVariant
+from store.fast_serializers import product_reader
+
+STATE_KEY = "catalog:state"
+
+
+def _cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _key(product_id):
+    return f"catalog:product:{product_id}"
+
+
+def _price_key(product_id):
+    return f"catalog:price:{product_id}"
+
+
+def refresh_products(product_ids):
+    """Rebuild the snapshot for the given products and return {id: bytes}."""
+    # Cloudinary URLs are already absolute, so the output does not depend
+    # on the request and one snapshot serves every visitor.
+    renderer = FastJSONRenderer()
+    rows = product_reader.values(Product.objects.filter(pk__in=product_ids))
+    fresh = {data['id']: renderer.render(data) for data in product_reader.serialize(rows)}
+    cache = _cache()
+    cache.set_many({_key(pk): body for pk, body in fresh.items()}, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    gone = [_key(pk) for pk in product_ids if pk not in fresh]
+    if gone:
+        cache.delete_many(gone)
+    return fresh
+
+
+def schedule_refresh(product_ids, stock_only=False):
+    """
+    Drop stale entries now and rebuild them once the write has committed.
+    With `stock_only` the checkout price blocks, which carry no stock, are kept.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    prices = [] if stock_only else [_price_key(pk) for pk in product_ids]
+    _cache().delete_many([_key(pk) for pk in product_ids] + prices + [STATE_KEY])
+
+    def rebuild():
+        refresh_products(product_ids)
+        # A checkout while the write was still open may have cached the old price.
+        _cache().delete_many(prices + [STATE_KEY])
+
+    # The write has already committed by then; a failed rebuild only leaves a
+    # cache miss that get_products_json() fills later, so it must not raise.
+    transaction.on_commit(rebuild, robust=True)
+
+
+def invalidate_products(product_ids):
+    """Drop entries without rebuilding them, for bulk writes that bypass signals."""
+    stale = [_key(pk) for pk in product_ids] + [_price_key(pk) for pk in product_ids] + [STATE_KEY]
+    _cache().delete_many(stale)
+    # Again after commit: a read while the write was still open may have
+    # cached the old rows.
+    transaction.on_commit(lambda: _cache().delete_many(stale))
+
+
+def invalidate_state():
+    """Force a new catalog version, e.g. after a change that touches no product."""
+    _cache().delete(STATE_KEY)
+    transaction.on_commit(lambda: _cache().delete(STATE_KEY))
+
+
+def _stock_key(variant_id):
+    return f"stock:{variant_id}"
+
+
+def get_stock_levels(variant_ids):
+    """Return {variant_id: stock}, from the cache where possible and one query for the rest."""
+    cache = _cache()
+    cached = cache.get_many([_stock_key(pk) for pk in variant_ids])
+    levels = {pk: cached[_stock_key(pk)] for pk in variant_ids if _stock_key(pk) in cached}
+    missing = [pk for pk in variant_ids if pk not in levels]
+    if missing:
+        fresh = dict(ProductVariant.objects.filter(pk__in=missing).values_list('id', 'stock'))
+        cache.set_many({_stock_key(pk): stock for pk, stock in fresh.items()}, timeout=settings.STOCK_CACHE_TIMEOUT)
+        levels.update(fresh)
+    return levels
+
+
+def invalidate_stock(variant_ids):
+    _cache().delete_many([_stock_key(pk) for pk in variant_ids])
+
+
+def catalog_state():
+    """Return (version, last_modified) for the catalog, recomputing it after any change."""
+    cache = _cache()
+    state = cache.get(STATE_KEY)
+    if state is None:
+        last_modified = max(
+            filter(None, [
+                Product.objects.aggregate(latest=Max('updated_at'))['latest'],
+                ProductVariant.objects.aggregate(latest=Max('updated_at'))['latest'],
+            ]),
+            default=None,
+        )
+        state = (uuid.uuid4().hex, last_modified)
+        cache.set(STATE_KEY, state, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return state
+
+
+def catalog_etag(request, *args, **kwargs):
+    # Strong validator: one catalog version always renders the same bytes
+    # for a given path and query string (cursor, page size) and Accept
+    # header, which picks between DRF's JSON and browsable HTML renderings.
+    # Views using it must send Vary: Accept.
+    version, _ = catalog_state()
+    accept = request.META.get("HTTP_ACCEPT", "")
+    return hashlib.sha1(f"{version}:{request.get_full_path()}:{accept}".encode()).hexdigest()
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return catalog_state()[1]
+
+
+def get_products_json(product_ids):
+    """Return {id: bytes} for the given products in one cache round trip, filling misses from the database."""
+    cached = _cache().get_many([_key(pk) for pk in product_ids])
+    found = {pk: cached[_key(pk)] for pk in product_ids if _key(pk) in cached}
+    missing = [pk for pk in product_ids if pk not in found]
+    if missing:
+        found.update(refresh_products(missing))
+    return found
+
+
+def unit_amount(price):
+    """A Decimal price as integer cents, without a detour through float."""
+    return int((price * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def get_price_data(variants):
+    """
+    Return {variant_id: Stripe price_data} for the given variants, whose
+    products must already be loaded. unit_amount always comes from the
+    loaded product.price; only the product_data blocks (name, description,
+    Cloudinary image URL) come from the cache, with one query for products
+    not in it. Entries are dropped with the product snapshot whenever the
+    product or one of its variants or images changes.
+    """
+    product_ids = {variant.product_id for variant in variants}
+    cache = _cache()
+    cached = cache.get_many([_price_key(pk) for pk in product_ids])
+    blocks = {}
+    for product_blocks in cached.values():
+        blocks.update(product_blocks)
+    missing = [pk for pk in product_ids if _price_key(pk) not in cached]
+    if missing:
+        fresh = {pk: {} for pk in missing}
+        for variant in ProductVariant.objects.filter(product_id__in=missing).select_related('product'):
+            product = variant.product
+            # Cloudinary URLs are absolute, so the block is request-independent.
+            fresh[product.pk][variant.pk] = {
+                'name': f"{product.name} - {variant.size or 'Default'}",
+                'description': product.description,
+                'images': [product.image.url] if product.image else [],
+            }
+        cache.set_many({_price_key(pk): product_blocks for pk, product_blocks in fresh.items()}, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        for product_blocks in fresh.values():
+            blocks.update(product_blocks)
+    return {
+        variant.pk: {
+            'currency': 'usd',
+            'unit_amount': unit_amount(variant.product.price),
+            'product_data': blocks[variant.pk],
+        }
+        for variant in variants
+    }
@@ -0,0 +1,170 @@
+"""
+Compiled, read-only serialization for the hot GET endpoints.
+
+ProductSerializer, CartItemSerializer and OrderSerializer are walked once at
+import time and turned into a flat list of (key, reader) steps over
+``.values()`` rows, reusing each DRF field's own ``to_representation`` for
+formatting. Serializing a page is then plain dict building. There is no
+per-object field binding, model instance construction or nested serializer
+instantiation. Related rows are loaded with one query per relation, so the
+query count is constant in the number of objects.
+
+Output is identical to the DRF serializers; store/tests.py compares the two
+on the same data, and benchmarks/serializers.py measures the gain.
+"""
+from collections import defaultdict
+
+from rest_framework.fields import ModelField, SerializerMethodField
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.serializers import BaseSerializer
+
+from store.models import Category, OrderItem, Product, ProductImage, ProductVariant
+from store.serializers import (
+    CartItemSerializer, CategorySerializer, OrderItemSerializer, OrderSerializer,
+    ProductImageSerializer, ProductSerializer, ProductVariantSerializer,
+)
+
+
+def _column_reader(column, field, model_field):
+    if isinstance(field, PrimaryKeyRelatedField):
+        return lambda row, ctx: row[column]
+    if isinstance(field, ModelField):
+        # CloudinaryField: values() already returns the parsed resource and
+        # ModelField renders it through value_to_string -> get_prep_value.
+        to_string = model_field.get_prep_value
+        return lambda row, ctx: None if row[column] is None else to_string(row[column])
+    to_representation = field.to_representation
+    return lambda row, ctx: None if row[column] is None else to_representation(row[column])
+
+
+class _Plan:
+    """Key order and per-key readers for one serializer, plus the columns they read."""
+
+    def __init__(self, serializer, **special):
+        model = serializer.Meta.model
+        self.columns = {'id'}
+        self.steps = []
+        for name, field in serializer.fields.items():
+            if name in special:
+                self.steps.append((name, special[name]))
+                continue
+            if isinstance(field, (BaseSerializer, SerializerMethodField)):
+                raise TypeError(f"{type(serializer).__name__}.{name} needs an explicit reader")
+            model_field = model._meta.get_field(field.source)
+            self.columns.add(model_field.attname)
+            self.steps.append((name, _column_reader(model_field.attname, field, model_field)))
+
+    def build(self, row, ctx):
+        return {name: read(row, ctx) for name, read in self.steps}
+
+
+def _image_url(row, ctx):
+    image = row['image']
+    if not image:
+        return None
+    url = image.url
+    return ctx.request.build_absolute_uri(url) if ctx.request else url
+
+
+_category = _Plan(CategorySerializer())
+_image = _Plan(ProductImageSerializer())
+_variant = _Plan(ProductVariantSerializer())
+_product = _Plan(
+    ProductSerializer(),
+    category=lambda row, ctx: ctx.categories.get(row['category_id']),
+    images=lambda row, ctx: ctx.images[row['id']],
+    variants=lambda row, ctx: ctx.variants[row['id']],
+    image_url=_image_url,
+)
+_product.columns.update({'category_id', 'image'})
+
+
+def _line_variant(row, ctx):
+    return ctx.line_variants.get(row['variant_id'])
+
+
+def _line_product(row, ctx):
+    variant = ctx.line_variants.get(row['variant_id'])
+    return ctx.products[variant['product']] if variant else None
+
+
+_cart_item = _Plan(CartItemSerializer(), variant=_line_variant, product=_line_product)
+_cart_item.columns.add('variant_id')
+_order_item = _Plan(OrderItemSerializer(), variant=_line_variant, product=_line_product)
+_order_item.columns.update({'variant_id', 'order_id'})
+_order = _Plan(
+    OrderSerializer(),
+    items=lambda row, ctx: ctx.order_items[row['id']],
+    status=lambda row, ctx: row['stripe_payment_status'] or "pending",
+)
+_order.columns.add('stripe_payment_status')
+
+
+class _Context:
+    def __init__(self, request):
+        self.request = request
+        self.categories = {}
+        self.images = defaultdict(list)
+        self.variants = defaultdict(list)
+        self.products = {}
+        self.line_variants = {}
+        self.order_items = defaultdict(list)
+
+    def load_products(self, product_rows):
+        ids = [row['id'] for row in product_rows]
+        category_ids = {row['category_id'] for row in product_rows if row['category_id'] is not None}
+        if category_ids:
+            for row in Category.objects.filter(id__in=category_ids).values(*_category.columns):
+                self.categories[row['id']] = _category.build(row, self)
+        for row in ProductImage.objects.filter(product_id__in=ids).order_by('id').values(*_image.columns, 'product_id'):
+            self.images[row['product_id']].append(_image.build(row, self))
+        for row in ProductVariant.objects.filter(product_id__in=ids).order_by('id').values(*_variant.columns):
+            self.variants[row['product_id']].append(_variant.build(row, self))
+        for row in product_rows:
+            self.products[row['id']] = _product.build(row, self)
+
+    def load_line_items(self, line_rows):
+        variant_ids = {row['variant_id'] for row in line_rows if row['variant_id'] is not None}
+        if not variant_ids:
+            return
+        # The lines' variants are among their products' variants, which
+        # load_products() builds anyway.
+        product_ids = ProductVariant.objects.filter(id__in=variant_ids).values('product_id')
+        self.load_products(list(Product.objects.filter(id__in=product_ids).values(*_product.columns)))
+        for variants in self.variants.values():
+            for variant in variants:
+                if variant['id'] in variant_ids:
+                    self.line_variants[variant['id']] = variant
+
+    def load_orders(self, order_rows):
+        items = list(
+            OrderItem.objects.filter(order_id__in=[row['id'] for row in order_rows]).order_by('id').values(*_order_item.columns)
+        )
+        self.load_line_items(items)
+        for row in items:
+            self.order_items[row['order_id']].append(_order_item.build(row, self))
+
+
+class _Reader:
+    """values() projection + builder for one top-level serializer."""
+
+    def __init__(self, plan, load):
+        self.plan = plan
+        # load(ctx, rows) fills the context with the related rows the plan's readers look up.
+        self.load = load
+
+    def values(self, queryset):
+        """The queryset as rows carrying every column serialize() reads; safe to paginate."""
+        # Relations are loaded by serialize(); instance prefetches don't apply to rows.
+        return queryset.prefetch_related(None).values(*self.plan.columns)
+
+    def serialize(self, rows, request=None):
+        rows = list(rows)
+        ctx = _Context(request)
+        self.load(ctx, rows)
+        return [self.plan.build(row, ctx) for row in rows]
+
+
+product_reader = _Reader(_product, _Context.load_products)
+cart_item_reader = _Reader(_cart_item, _Context.load_line_items)
+order_reader = _Reader(_order, _Context.load_orders)
@@ -0,0 +1,89 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import CharField, Count, Exists, F, OuterRef, Value
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from store.models import ProductVariant
+
+
+def _decimal_param(params, name):
+    raw = params.get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        return Decimal(raw)
+    except InvalidOperation:
+        raise ValidationError({name: "Must be a number."})
+
+
+def filter_products(queryset, params):
+    """
+    Narrow a Product queryset by ?category=<slug>, ?size=<a,b>, ?in_stock=true,
+    ?min_price= and ?max_price=.
+
+    Size and stock are checked against the same variant with an EXISTS
+    subquery, so "size 7, in stock" means a size-7 variant with stock and
+    products never repeat the way a join on variants would make them.
+    """
+    category = params.get('category')
+    if category:
+        queryset = queryset.filter(category__slug=category)
+
+    min_price = _decimal_param(params, 'min_price')
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    max_price = _decimal_param(params, 'max_price')
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    sizes = [size for size in params.get('size', '').split(',') if size]
+    in_stock = params.get('in_stock', '').lower() in ('1', 'true', 'yes')
+    if sizes or in_stock:
+        variants = ProductVariant.objects.filter(product=OuterRef('pk'))
+        if sizes:
+            variants = variants.filter(size__in=sizes)
+        if in_stock:
+            variants = variants.filter(stock__gt=0)
+        queryset = queryset.filter(Exists(variants))
+
+    return queryset
+
+
+def product_facets(queryset):
+    """
+    Count products per category, per variant size and in stock for an
+    already filtered Product queryset, in a single UNION ALL query.
+    """
+    product_ids = queryset.values('pk')
+    variants = ProductVariant.objects.filter(product__in=product_ids)
+
+    def facet(qs, name, value, count):
+        return (
+            qs.annotate(facet=Value(name, output_field=CharField()), value=value)
+            .values('facet', 'value')
+            .annotate(count=count)
+            .values_list('facet', 'value', 'count')
+            .order_by()
+        )
+
+    rows = facet(
+        queryset.model.objects.filter(pk__in=product_ids), 'category', F('category__slug'), Count('pk')
+    ).union(
+        facet(variants, 'size', F('size'), Count('product', distinct=True)),
+        facet(variants.filter(stock__gt=0), 'in_stock', Value('true', output_field=CharField()), Count('product', distinct=True)),
+        all=True,
+    )
+
+    facets = {'category': {}, 'size': {}, 'in_stock': 0}
+    for name, value, count in rows:
+        if name == 'in_stock':
+            facets['in_stock'] = count
+        elif value is not None:
+            facets[name][value] = count
+    return facets
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        return filter_products(queryset, request.query_params)
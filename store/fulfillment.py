@@ -0,0 +1,161 @@
+"""
+Job handlers for Stripe checkout events, queued by stripe_webhook.
+
+Jobs can run more than once (see store/jobs.py). The completed-checkout
+handler skips sessions that already have an order. Otherwise it creates the
+order, takes its stock and clears the cart in one transaction, which also
+queues the order emails. A failed attempt therefore leaves nothing behind
+for the retry to trip over. Each email is a job of its own, so a failed send
+is retried without resending the other.
+"""
+import json
+
+import stripe
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from store import jobs, reservations
+from store.models import Cart, Order, OrderItem, ProductVariant
+
+stripe.api_key = settings.STRIPE_SECRET_KEY
+
+
+@jobs.handler("stripe.checkout.session.completed")
+def checkout_completed(session):
+    session_id = session.get("id")
+    if Order.objects.filter(stripe_checkout_id=session_id).exists():
+        print(f"↩️ Order for session {session_id} already exists")
+        return
+
+    payment_status = session.get("payment_status")
+    email = session.get("customer_email")
+    metadata = session.get("metadata", {})
+
+    shipping_address = json.loads(metadata.get("shipping_address", "{}"))
+    shipping_cost = float(metadata.get("shipping_cost", "0.00"))
+    clerk_user_id = metadata.get("clerk_user_id", "")
+    is_guest = metadata.get("is_guest").lower() == "true"
+
+    # Reconstruct total & items
+    line_items = stripe.checkout.Session.list_line_items(session_id)
+    subtotal = sum(item.amount_total for item in line_items.data) / 100
+
+    first_name = metadata.get("first_name", "").strip()
+    last_name = metadata.get("last_name", "").strip()
+
+    with transaction.atomic():
+        # Create Order
+        order = Order.objects.create(
+            clerk_user_id=clerk_user_id or None,
+            email=email,
+            is_guest=is_guest,
+            subtotal=subtotal,
+            stripe_checkout_id=session_id,
+            stripe_payment_status=payment_status,
+            shipping_address=shipping_address,
+            shipping_cost=shipping_cost,
+            first_name=first_name,
+            last_name=last_name,
+        )
+
+        # Units held at checkout are already off the shelf; anything
+        # not held (e.g. the hold expired first, in whole or in part) is
+        # taken below, variant by variant.
+        held = reservations.convert(metadata.get("reservation"))
+
+        # Add OrderItems
+        for item in line_items.data:
+            product_name = item.description
+            quantity = item.quantity
+            unit_price = item.amount_total / quantity / 100
+
+            variant = ProductVariant.objects.select_related("product").filter(
+                product__name__in=product_name.split(" - "),
+                size=product_name.split(" - ")[-1] if " - " in product_name else None
+            ).first()
+
+            if variant:
+                OrderItem.objects.create(
+                    order=order,
+                    variant=variant,
+                    quantity=quantity,
+                    price=unit_price,
+                )
+                covered = min(held.get(variant.pk, 0), quantity)
+                held[variant.pk] = held.get(variant.pk, 0) - covered
+                if quantity > covered:
+                    reservations.deduct_stock(variant, quantity - covered)
+            else:
+                print(f"⚠️ Variant not found for name: {product_name}")
+
+        # Clear cart if user is logged in
+        if clerk_user_id:
+            cart = Cart.objects.filter(clerk_user_id=clerk_user_id).first()
+            if cart:
+                cart.delete()
+                print(f"🧹 Cart cleared for user: {clerk_user_id}")
+
+        if order.email:
+            jobs.enqueue("order.confirmation_email", {"order_id": order.id})
+            if settings.STORE_OWNER_EMAIL:
+                jobs.enqueue("order.owner_notification", {"order_id": order.id})
+
+
+@jobs.handler("stripe.checkout.session.expired")
+def checkout_expired(session):
+    released = reservations.release(session.get("metadata", {}).get("reservation"))
+    if released:
+        print(f"🔓 Released held stock for expired session {session.get('id')}")
+
+
+@jobs.handler("order.confirmation_email")
+def send_confirmation_email(payload):
+    order = Order.objects.get(pk=payload["order_id"])
+    html_message = render_to_string("emails/order_confirmation.html", {
+        "first_name": order.first_name,
+        "order_id": order.id,
+        "items": order.items.select_related("variant__product"),
+        "total": order.grand_total,
+        "shipping_cost": order.shipping_cost,
+        "shipping_address": order.shipping_address,
+        "now": timezone.now(),
+    })
+
+    email_msg = EmailMessage(
+        subject=f"Your BuddhaBasha Order #{order.id}",
+        body=html_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[order.email],
+    )
+    email_msg.content_subtype = "html"
+    email_msg.send(fail_silently=False)
+    print("📧 Confirmation email sent")
+
+
+@jobs.handler("order.owner_notification")
+def send_owner_notification(payload):
+    order = Order.objects.get(pk=payload["order_id"])
+    internal_html = render_to_string("emails/order_notification.html", {
+        "first_name": order.first_name,
+        "last_name": order.last_name,
+        "order_id": order.id,
+        "items": order.items.select_related("variant__product"),
+        "total": order.grand_total,
+        "shipping_cost": order.shipping_cost,
+        "shipping_address": order.shipping_address,
+        "customer_email": order.email,
+        "now": timezone.now(),
+    })
+
+    owner_msg = EmailMessage(
+        subject=f"🛍️ New Order #{order.id} - BuddhaBasha",
+        body=internal_html,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[settings.STORE_OWNER_EMAIL],
+    )
+    owner_msg.content_subtype = "html"
+    owner_msg.send(fail_silently=False)
+    print("📧 Notification email sent to store owner")
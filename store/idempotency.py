@@ -0,0 +1,94 @@
+"""
+Idempotency-Key support for POST endpoints that must not run twice.
+
+The first request with a given key claims it with an atomic cache.add(),
+runs, and stores its status code and body for IDEMPOTENCY_TTL seconds. A
+retry with the same key and body gets that stored response back without
+running the view again. A retry that arrives while the first request is
+still running waits for it, for up to IDEMPOTENCY_WAIT_SECONDS. Reusing a key
+with a different body is rejected, as is a wait that runs out. The claim
+itself only lasts IDEMPOTENCY_PENDING_TTL seconds, so a key whose first
+request was killed mid-flight frees up soon after.
+
+Server errors are not stored: the key is freed so the client can retry.
+"""
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = "Idempotency-Key"
+PENDING = "pending"
+POLL_INTERVAL = 0.05
+
+
+def _cache():
+    return caches[settings.IDEMPOTENCY_CACHE_ALIAS]
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(entry, fingerprint):
+    if entry['fingerprint'] != fingerprint:
+        return Response(
+            {"error": f"{HEADER} was already used with a different request body"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(entry['data'], status=entry['status'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(scope):
+    """Make a DRF view method replay its first response for a repeated Idempotency-Key."""
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapped(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view_method(self, request, *args, **kwargs)
+
+            cache = _cache()
+            cache_key = f"idempotency:{scope}:{hashlib.sha256(key.encode()).hexdigest()}"
+            fingerprint = _fingerprint(request)
+            if not cache.add(cache_key, {'state': PENDING, 'fingerprint': fingerprint}, timeout=settings.IDEMPOTENCY_PENDING_TTL):
+                deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+                while True:
+                    entry = cache.get(cache_key)
+                    if entry is None:
+                        # The first request failed and freed the key: run it ourselves.
+                        return wrapped(self, request, *args, **kwargs)
+                    if entry['state'] != PENDING:
+                        return _replay(entry, fingerprint)
+                    if time.monotonic() >= deadline:
+                        return Response(
+                            {"error": "A request with this Idempotency-Key is still in progress"},
+                            status=status.HTTP_409_CONFLICT,
+                        )
+                    time.sleep(POLL_INTERVAL)
+
+            try:
+                response = view_method(self, request, *args, **kwargs)
+            except Exception:
+                cache.delete(cache_key)
+                raise
+            if response.status_code >= 500:
+                cache.delete(cache_key)
+            else:
+                cache.set(cache_key, {
+                    'state': 'done',
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                }, timeout=settings.IDEMPOTENCY_TTL)
+            return response
+        return wrapped
+    return decorator
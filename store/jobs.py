@@ -0,0 +1,104 @@
+"""
+A durable job queue kept in the database, for work that must not run inside
+a request: Stripe webhook processing and order emails.
+
+enqueue() adds a Job row, inside the caller's transaction if there is one, so
+a job is only queued if the work that queued it commits. `manage.py
+run_worker` processes run claim() then run() in a loop. Any number of
+workers can share the queue:
+
+* claim() locks due rows with SELECT ... FOR UPDATE SKIP LOCKED, so each
+  worker gets different jobs and nobody waits on another worker's locks.
+  (SQLite has no row locks and ignores this; run a single worker there.)
+* A claimed job is leased for JOB_LEASE_SECONDS. If its worker dies, the
+  lease runs out and another worker claims it again. Delivery is therefore
+  at least once, and handlers must be safe to run twice.
+* A job whose handler raises is retried with exponential backoff. After
+  JOB_MAX_ATTEMPTS tries it is marked dead and kept, with its last error,
+  for someone to look at and requeue() from the admin.
+
+Handlers are plain functions taking the job's payload, registered under a
+kind with @handler(kind).
+"""
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from store.models import Job
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register the decorated function to run jobs of `kind`."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload, key=None):
+    """
+    Queue a `kind` job. With a `key`, a job already queued under that key
+    wins and None is returned, so redelivered events are only queued once.
+    """
+    try:
+        with transaction.atomic():
+            return Job.objects.create(kind=kind, payload=payload, key=key)
+    except IntegrityError:
+        if key is None:
+            raise
+        return None
+
+
+def backoff(attempts):
+    """Seconds to wait before the next try of a job that has failed `attempts` times."""
+    ceiling = min(settings.JOB_MAX_BACKOFF, settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1))
+    # Jittered, so jobs that failed together don't all come back together.
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def claim(batch_size=10, now=None):
+    """Lease up to `batch_size` due jobs to this worker and return them, oldest first."""
+    now = now or timezone.now()
+    lease = now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[Job.QUEUED, Job.RUNNING], run_at__lte=now)
+            .order_by('run_at')[:batch_size]
+        )
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=Job.RUNNING, run_at=lease, attempts=F('attempts') + 1, updated_at=now,
+        )
+    for job in jobs:
+        job.status, job.run_at, job.attempts = Job.RUNNING, lease, job.attempts + 1
+    return jobs
+
+
+def run(job):
+    """Run a claimed job and record the outcome. Returns the job's new status."""
+    try:
+        HANDLERS[job.kind](job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            job.status = Job.DEAD
+        else:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+    else:
+        job.status = Job.DONE
+        job.last_error = ""
+    job.save(update_fields=['status', 'run_at', 'last_error', 'updated_at'])
+    return job.status
+
+
+def requeue(jobs):
+    """Give dead (or finished) jobs a fresh set of attempts, due now. Returns how many."""
+    return jobs.update(status=Job.QUEUED, attempts=0, run_at=timezone.now(), updated_at=timezone.now())
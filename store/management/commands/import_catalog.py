@@ -0,0 +1,130 @@
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from store import catalog, search
+from store.models import Category, Product, ProductVariant
+
+FIELDS = ['product_sku', 'name', 'description', 'price', 'image', 'category_slug', 'category_name', 'size', 'stock']
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert categories, products and variants from a CSV or JSONL file, one row per variant "
+        f"with columns: {', '.join(FIELDS)}. Products are matched on product_sku, variants on "
+        "(product, size) and categories on slug."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per transaction (default 1000).")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        started = time.monotonic()
+        total = 0
+        try:
+            for number, rows in enumerate(batched(read_rows(stream, fmt), batch_size), start=1):
+                with transaction.atomic():
+                    self.import_batch(rows, first_line=total + 1)
+                total += len(rows)
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"batch {number}: {total} rows, {total / elapsed:,.0f} rows/s")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total} rows in {time.monotonic() - started:.1f}s"
+        ))
+
+    def import_batch(self, rows, first_line):
+        categories, products, variants = {}, {}, {}
+        for line, row in enumerate(rows, start=first_line):
+            try:
+                sku = row['product_sku'].strip()
+                slug = (row.get('category_slug') or '').strip()
+                if not sku:
+                    raise ValueError("product_sku is required")
+                if slug:
+                    categories[slug] = Category(slug=slug, name=row.get('category_name') or slug)
+                products[sku] = (slug, Product(
+                    sku=sku,
+                    name=row['name'],
+                    description=row.get('description') or '',
+                    image=row.get('image') or '',
+                    price=Decimal(str(row['price'])),
+                ))
+                size = (row.get('size') or '').strip() or None
+                variants[(sku, size)] = int(row.get('stock') or 0)
+            except (KeyError, ValueError, InvalidOperation) as exc:
+                raise CommandError(f"Row {line}: {exc!r}")
+
+        Category.objects.bulk_create(
+            categories.values(), update_conflicts=True, unique_fields=['slug'], update_fields=['name'],
+        )
+        category_ids = dict(Category.objects.filter(slug__in=categories).values_list('slug', 'id'))
+
+        for slug, product in products.values():
+            product.category_id = category_ids.get(slug)
+        Product.objects.bulk_create(
+            [product for _, product in products.values()],
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=['name', 'description', 'image', 'price', 'category', 'updated_at'],
+        )
+        product_ids = dict(Product.objects.filter(sku__in=products).values_list('sku', 'id'))
+
+        # NULL sizes never conflict in a unique constraint, so size-less
+        # variants are matched explicitly and updated in place.
+        existing_unsized = dict(
+            ProductVariant.objects.filter(product_id__in=product_ids.values(), size__isnull=True)
+            .values_list('product_id', 'id')
+        )
+        now = timezone.now()
+        upserts, updates = [], []
+        for (sku, size), stock in variants.items():
+            product_id = product_ids[sku]
+            if size is None and product_id in existing_unsized:
+                updates.append(ProductVariant(id=existing_unsized[product_id], stock=stock, updated_at=now))
+            else:
+                upserts.append(ProductVariant(product_id=product_id, size=size, stock=stock))
+        ProductVariant.objects.bulk_create(
+            upserts, update_conflicts=True, unique_fields=['product', 'size'], update_fields=['stock', 'updated_at'],
+        )
+        ProductVariant.objects.bulk_update(updates, ['stock', 'updated_at'])
+
+        # Bulk writes skip model signals; do their work for the batch here.
+        for _, product in products.values():
+            product.pk = product_ids[product.sku]
+        search.index_products([product for _, product in products.values()])
+        catalog.invalidate_products(list(product_ids.values()))
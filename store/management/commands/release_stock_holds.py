@@ -0,0 +1,34 @@
+import time
+from itertools import count
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Return the stock of expired checkout holds to sale. Holds go in bounded batches, "
+        "each in its own short transaction; run it every few minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Holds per transaction (default 1000).")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        started = time.monotonic()
+        total = 0
+        for number in count(1):
+            batch_started = time.monotonic()
+            released = reservations.release_expired(batch_size)
+            if not released:
+                break
+            total += released
+            self.stdout.write(f"batch {number}: {released} holds in {time.monotonic() - batch_started:.2f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Released {total} expired holds in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,61 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import jobs
+from store.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        "Process the background job queue (store/jobs.py): Stripe webhook events and order emails. "
+        "Run as many workers as needed; they share the queue without running a job twice at once. "
+        "SIGTERM or Ctrl-C stops the worker after its current batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help="Jobs claimed at a time (default 10).")
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help="Seconds to wait before polling again when no job is due (default 1).",
+        )
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due instead of waiting.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        self.stopping = False
+        previous = {sig: signal.signal(sig, self.stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+        started = time.monotonic()
+        outcomes = {Job.DONE: 0, Job.QUEUED: 0, Job.DEAD: 0}
+        try:
+            while not self.stopping:
+                batch = jobs.claim(batch_size)
+                if not batch:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                for job in batch:
+                    job_started = time.monotonic()
+                    status = jobs.run(job)
+                    outcomes[status] += 1
+                    self.stdout.write(
+                        f"{job} attempt {job.attempts} in {time.monotonic() - job_started:.2f}s"
+                    )
+                    if status == Job.DEAD:
+                        self.stderr.write(job.last_error)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ran {sum(outcomes.values())} jobs in {time.monotonic() - started:.1f}s: "
+            f"{outcomes[Job.DONE]} done, {outcomes[Job.QUEUED]} to retry, {outcomes[Job.DEAD]} dead"
+        ))
+
+    def stop(self, signum, frame):
+        self.stopping = True
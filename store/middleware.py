@@ -1,6 +1,21 @@
+import hashlib
+from functools import wraps
+
 import jwt
-import requests
 from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from backend import outbound
+from store.carts import guest_cart_id, merge_guest_cart
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+CART_MERGED_SESSION_KEY = "store_cart_merged_for"
 
 class ClerkUserMiddleware:
     def __init__(self, get_response):
@@ -15,7 +30,7 @@ class ClerkUserMiddleware:
                 # Load Clerk JWKS (public keys)
                 if not self.jwks:
                     jwks_url = settings.CLERK_JWKS_URL
-                    self.jwks = requests.get(jwks_url).json()
+                    self.jwks = outbound.session("clerk").get(jwks_url).json()
                 
                 # Decode token
                 unverified_header = jwt.get_unverified_header(token)
@@ -31,10 +46,142 @@ class ClerkUserMiddleware:
             except Exception as e:
                 print(f"❌ Clerk token decode error: {e}")
 
+            if getattr(request, "clerk_user_id", None):
+                try:
+                    self.merge_guest_cart(request)
+                except Exception as e:
+                    # The session isn't marked merged, so the next request retries.
+                    print(f"❌ Guest cart merge error for {request.clerk_user_id}: {e}")
+
         # Fallback for guests (query param)
         if not hasattr(request, "clerk_user_id"):
             guest_id = request.GET.get("clerk_user_id")
             if guest_id:
                 request.clerk_user_id = guest_id
 
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+    def merge_guest_cart(self, request):
+        # First authenticated request of a session: fold the guest cart in.
+        session = getattr(request, "session", None)
+        user_id = request.clerk_user_id
+        if not user_id or session is None or not session.session_key:
+            return
+        if session.get(CART_MERGED_SESSION_KEY) == user_id:
+            return
+        merge_guest_cart(guest_cart_id(session.session_key), user_id)
+        session[CART_MERGED_SESSION_KEY] = user_id
+
+
+def compression_exempt(view_func):
+    """Mark a view whose responses CompressionMiddleware must pass through untouched."""
+    @wraps(view_func)
+    def wrapped_view(*args, **kwargs):
+        return view_func(*args, **kwargs)
+    wrapped_view.compression_exempt = True
+    return wrapped_view
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Brotli (when the brotli package is installed) or gzip compression for
+    API responses, negotiated from Accept-Encoding.
+
+    Bodies under COMPRESSION_MIN_SIZE bytes are sent as is. Streaming
+    responses are compressed chunk by chunk unless the view is decorated
+    with @compression_exempt. Responses carrying a strong ETag (the catalog
+    endpoints) have their compressed bytes cached under that ETag, so a hot
+    catalog page is compressed once per catalog version rather than once
+    per request. Like Django's GZipMiddleware, the ETag of a compressed
+    response is weakened.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(request, "_compression_exempt", False) or response.has_header("Content-Encoding"):
+            return response
+        if response.streaming:
+            if getattr(response, "is_async", False):
+                return response
+        elif len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        accepted = _accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            return response
+
+        if response.streaming:
+            if encoding == "br":
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers["Content-Length"]
+        else:
+            compressed = self.compress(response, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, "compression_exempt", False):
+            request._compression_exempt = True
+
+    def compress(self, response, encoding):
+        etag = response.get("ETag")
+        if not etag or not etag.startswith('"'):
+            return self._compress(response.content, encoding)
+        # A strong ETag identifies these exact bytes, so the compressed form
+        # can be reused. The Content-Type goes into the key as well, so that
+        # renderings sharing an ETag can never be served for one another.
+        cache = caches[settings.COMPRESSION_CACHE_ALIAS]
+        identity = f"{etag}:{response.get('Content-Type', '')}"
+        key = "compressed:%s:%s" % (encoding, hashlib.sha1(identity.encode()).hexdigest())
+        compressed = cache.get(key)
+        if compressed is None:
+            compressed = self._compress(response.content, encoding)
+            cache.set(key, compressed, timeout=settings.COMPRESSION_CACHE_TIMEOUT)
+        return compressed
+
+    def _compress(self, content, encoding):
+        if encoding == "br":
+            return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        return compress_string(content)
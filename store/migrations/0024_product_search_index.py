@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# The search index lives outside the ORM so ProductSerializer's '__all__'
+# never sees it. See store/search.py for how each backend is queried.
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE store_product ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION store_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER store_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON store_product
+    FOR EACH ROW EXECUTE FUNCTION store_product_search_vector_update()
+    """,
+    "UPDATE store_product SET name = name",
+    "CREATE INDEX store_product_search_vector_idx ON store_product USING GIN (search_vector)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP TRIGGER IF EXISTS store_product_search_vector_trigger ON store_product",
+    "DROP FUNCTION IF EXISTS store_product_search_vector_update()",
+    "ALTER TABLE store_product DROP COLUMN IF EXISTS search_vector",
+]
+
+# Standalone (not external-content) table: SQLite migrations rebuild
+# store_product by copy-and-rename, which would silently drop triggers, so
+# store/signals.py keeps this table in sync instead.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE store_product_fts USING fts5(
+        name, description, tokenize='porter unicode61', prefix='2 3'
+    )
+    """,
+    "INSERT INTO store_product_fts(rowid, name, description) SELECT id, name, description FROM store_product",
+]
+
+SQLITE_REVERSE = [
+    "DROP TABLE IF EXISTS store_product_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_product_variant_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': POSTGRES_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
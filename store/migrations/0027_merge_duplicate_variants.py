@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_variants(apps, schema_editor):
+    # Fold repeated (product, size) variants into the oldest one, pooling
+    # their stock and moving cart and order lines over, so the constraint
+    # can be added by 0028. Size-less variants never conflict and are left
+    # alone. Cart lines that now repeat a variant are merged by 0029.
+    ProductVariant = apps.get_model('store', 'ProductVariant')
+    CartItem = apps.get_model('store', 'CartItem')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    duplicates = (
+        ProductVariant.objects.filter(size__isnull=False)
+        .values('product_id', 'size')
+        .annotate(variants=Count('id'), keep=Min('id'), total=Sum('stock'))
+        .filter(variants__gt=1)
+    )
+    for row in duplicates:
+        variants = ProductVariant.objects.filter(product_id=row['product_id'], size=row['size'])
+        extra = list(variants.exclude(id=row['keep']).values_list('id', flat=True))
+        CartItem.objects.filter(variant_id__in=extra).update(variant_id=row['keep'])
+        OrderItem.objects.filter(variant_id__in=extra).update(variant_id=row['keep'])
+        ProductVariant.objects.filter(id__in=extra).delete()
+        variants.filter(id=row['keep']).update(stock=row['total'])
+
+
+class Migration(migrations.Migration):
+    # Data only: on PostgreSQL these writes leave deferred FK trigger events
+    # that would block an ALTER TABLE in the same migration.
+
+    dependencies = [
+        ('store', '0026_product_sku'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_variants, migrations.RunPython.noop),
+    ]
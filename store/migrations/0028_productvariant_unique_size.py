@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0027_merge_duplicate_variants'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='productvariant',
+            constraint=models.UniqueConstraint(fields=('product', 'size'), name='unique_variant_product_size'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:01
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    # Fold repeated (cart, variant) lines into the oldest one so the
+    # constraint can be added.
+    CartItem = apps.get_model('store', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'variant_id')
+        .annotate(lines=Count('id'), keep=Min('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        lines = CartItem.objects.filter(cart_id=row['cart_id'], variant_id=row['variant_id'])
+        lines.exclude(id=row['keep']).delete()
+        lines.filter(id=row['keep']).update(quantity=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0028_productvariant_unique_size'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'variant'), name='unique_cart_item_variant'),
+        ),
+    ]
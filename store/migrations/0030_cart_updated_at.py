@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    Cart = apps.get_model('store', 'Cart')
+    Cart.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0029_cartitem_unique_variant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
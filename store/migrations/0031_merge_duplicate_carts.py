@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    # Keep the most recently used cart per owner and fold the others' lines
+    # into it, so clerk_user_id can become unique in 0032.
+    Cart = apps.get_model('store', 'Cart')
+    CartItem = apps.get_model('store', 'CartItem')
+    owners = (
+        Cart.objects.exclude(clerk_user_id=None)
+        .values('clerk_user_id').annotate(carts=Count('id')).filter(carts__gt=1)
+        .values_list('clerk_user_id', flat=True)
+    )
+    for owner in owners:
+        keep, *others = Cart.objects.filter(clerk_user_id=owner).order_by('-updated_at', '-id')
+        lines = {item.variant_id: item for item in CartItem.objects.filter(cart=keep)}
+        for item in CartItem.objects.filter(cart__in=others).order_by('id'):
+            if item.variant_id in lines:
+                lines[item.variant_id].quantity += item.quantity
+                lines[item.variant_id].save(update_fields=['quantity'])
+                item.delete()
+            else:
+                item.cart = keep
+                item.save(update_fields=['cart'])
+                lines[item.variant_id] = item
+        Cart.objects.filter(id__in=[cart.id for cart in others]).delete()
+
+
+class Migration(migrations.Migration):
+    # Kept apart from 0032: on PostgreSQL the cart moves and deletes queue
+    # deferred FK checks, and ALTER TABLE store_cart refuses to run while
+    # they are pending in the same transaction.
+
+    dependencies = [
+        ('store', '0030_cart_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+    ]
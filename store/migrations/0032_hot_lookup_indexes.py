@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0031_merge_duplicate_carts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cart',
+            name='clerk_user_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('clerk_user_id__isnull', False)), fields=['clerk_user_id', '-created_at', '-id'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['email'], name='order_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='product_name_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0034_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockreservation',
+            name='owner',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0035_stockreservation_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockreservation',
+            name='checkout_session',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from cloudinary.models import CloudinaryField
 
 class UserProfile(models.Model):
@@ -23,13 +24,62 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def for_catalog(self):
+        # Everything ProductSerializer touches, loaded in a fixed number of
+        # queries no matter how many products are on the page.
+        return self.select_related('category').prefetch_related(
+            models.Prefetch('images', queryset=ProductImage.objects.order_by('id')),
+            models.Prefetch('variants', queryset=ProductVariant.objects.order_by('id')),
+        )
+
+    def for_fields(self, fields):
+        # Load only what the requested ProductSerializer fields read. Its
+        # model fields share the columns' names, so new columns need no
+        # change here. created_at is always kept: the cursor paginator orders on it.
+        fields = set(fields)
+        columns = {'id', 'created_at'} | {
+            field.name for field in self.model._meta.concrete_fields if field.name in fields
+        }
+        if 'image_url' in fields:
+            columns.add('image')
+        queryset = self
+        if 'category' in fields:
+            queryset = queryset.select_related('category')
+        if 'images' in fields:
+            queryset = queryset.prefetch_related(
+                models.Prefetch('images', queryset=ProductImage.objects.order_by('id'))
+            )
+        if 'variants' in fields:
+            queryset = queryset.prefetch_related(
+                models.Prefetch('variants', queryset=ProductVariant.objects.order_by('id'))
+            )
+        return queryset.only(*columns)
+
+    def for_card(self):
+        in_stock = ProductVariant.objects.filter(product=models.OuterRef('pk'), stock__gt=0)
+        return self.only('id', 'name', 'price', 'image', 'created_at').annotate(in_stock=models.Exists(in_stock))
+
 class Product(models.Model):
+    # Merchant SKU; the natural key `manage.py import_catalog` upserts on.
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     description = models.TextField()
     image = CloudinaryField('image', folder='buddhabasha/')
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            # Stripe webhook matches line items back to variants by product name.
+            models.Index(fields=['name'], name='product_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -38,10 +88,74 @@ class ProductVariant(models.Model):
     product = models.ForeignKey(Product, related_name='variants', on_delete=models.CASCADE)
     size = models.CharField(max_length=50, blank=True, null=True)
     stock = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'size', 'stock'], name='variant_product_size_stock_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'size'], name='unique_variant_product_size'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.size or 'Default'}"
         
+class StockReservation(models.Model):
+    # A checkout's hold on units already taken out of ProductVariant.stock.
+    # See store/reservations.py for the lifecycle.
+    reference = models.UUIDField(db_index=True)
+    # The signed-in buyer's Clerk id, blank for guests. A new checkout by the
+    # same buyer expires their older session and releases its hold.
+    owner = models.CharField(max_length=255, blank=True, db_index=True)
+    # The Stripe checkout session the hold is for, once it has been created.
+    checkout_session = models.CharField(max_length=255, blank=True)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.variant_id} held until {self.expires_at:%Y-%m-%d %H:%M}"
+
+class Job(models.Model):
+    # Background work run by `manage.py run_worker`. See store/jobs.py.
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (DEAD, 'Dead'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    # Optional dedupe key, e.g. the Stripe event id of a redelivered webhook.
+    key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    # When a queued job is next due, or when a running job's lease runs out.
+    run_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # jobs.claim(): due jobs, oldest first. Done and dead rows stay out of it.
+            models.Index(
+                fields=['run_at'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='job_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = CloudinaryField('image', folder='buddhabasha/')
@@ -50,15 +164,35 @@ class ProductImage(models.Model):
     def __str__(self):
         return f"Image for {self.product.name}"
     
+class LineItemQuerySet(models.QuerySet):
+    def with_products(self):
+        # Everything CartItemSerializer/OrderItemSerializer touch, in a
+        # fixed number of queries however many lines there are.
+        return self.select_related('variant__product__category').prefetch_related(
+            models.Prefetch('variant__product__images', queryset=ProductImage.objects.order_by('id')),
+            models.Prefetch('variant__product__variants', queryset=ProductVariant.objects.order_by('id')),
+        )
+
 class Cart(models.Model):
-    clerk_user_id = models.CharField(max_length=255, null=True, blank=True)
+    # One cart per Clerk user or guest session; store.carts.upsert_cart relies on it.
+    clerk_user_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever the cart's lines change (store.carts.touch_cart);
+    # `manage.py purge_carts` deletes carts idle past CART_IDLE_DAYS.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = LineItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'variant'], name='unique_cart_item_variant'),
+        ]
+
 class Order(models.Model):
     clerk_user_id = models.CharField(max_length=255, null=True, blank=True)
     email = models.EmailField()
@@ -91,6 +225,19 @@ class Order(models.Model):
     parcel_weight = models.DecimalField(max_digits=5, decimal_places=2, default=1.00)  # in pounds
     selected_rate_id = models.CharField(max_length=255, null=True, blank=True) 
   
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            # OrderViewSet: one user's orders, newest first.
+            models.Index(
+                fields=['clerk_user_id', '-created_at', '-id'],
+                condition=models.Q(clerk_user_id__isnull=False),
+                name='order_user_created_idx',
+            ),
+            # clerk_user_created_webhook claims guest orders by email.
+            models.Index(fields=['email'], name='order_email_idx'),
+        ]
+
 
     def grand_total(self):
         return self.subtotal + self.shipping_cost
@@ -99,4 +246,6 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True)
     quantity = models.PositiveIntegerField()
-    price = models.DecimalField(max_digits=10, decimal_places=2)
\ No newline at end of file
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    objects = LineItemQuerySet.as_manager()
\ No newline at end of file
@@ -0,0 +1,38 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+from backend.renderers import FastJSONRenderer
+
+
+class StoreCursorPagination(CursorPagination):
+    """
+    Keyset pagination: each page is a `WHERE (created_at, id) < cursor`
+    range scan on an index, so page 500 costs the same as page 1 and rows
+    inserted while a client is paging never shift or duplicate results.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = settings.STORE_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_paginated_bytes(self, rendered_results):
+        """Same envelope as get_paginated_response, built from already-rendered JSON results."""
+        links = FastJSONRenderer().render({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        })
+        # links is '{"next":...,"previous":...}'; splice results in before the closing brace.
+        return links[:-1] + b',"results":[' + b','.join(rendered_results) + b']}'
+
+
+class ProductCursorPagination(StoreCursorPagination):
+    pass
+
+
+class OrderCursorPagination(StoreCursorPagination):
+    pass
+
+
+class CartItemCursorPagination(StoreCursorPagination):
+    # Cart items have no timestamp; ids are monotonic, so keep add order.
+    ordering = ('id',)
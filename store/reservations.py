@@ -0,0 +1,183 @@
+"""
+Time-boxed stock holds for checkout.
+
+StripeCheckoutView calls reserve() before creating the Stripe session. The
+held units come straight out of ProductVariant.stock with one conditional
+UPDATE ... WHERE stock >= quantity, so concurrent buyers can never take the
+same last unit and the storefront stops offering held stock. Each hold is
+recorded as StockReservation rows sharing a reference that travels to Stripe
+in the session metadata.
+
+The hold then ends one of three ways:
+
+* convert() in stripe_webhook when the session is paid. The units stay
+  sold and the rows are dropped.
+* release() when the session can't be created or Stripe reports it expired.
+  The units go back on sale.
+* release_expired(), run by `manage.py release_stock_holds`, for holds
+  nobody ended before expires_at.
+
+Bulk UPDATEs skip model signals, so every path clears the affected catalog
+snapshots and stock levels itself.
+"""
+import uuid
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+from django.db.models.functions import Greatest, Now
+from django.utils import timezone
+
+from store import catalog
+from store.models import ProductVariant, StockReservation
+
+# Rows outlive the Stripe session by this much, so a payment made in the
+# session's last seconds still finds its hold when the webhook arrives.
+WEBHOOK_GRACE = timedelta(minutes=10)
+
+Hold = namedtuple('Hold', ['reference', 'expires_at'])
+
+
+class InsufficientStock(Exception):
+    def __init__(self, available):
+        super().__init__("Not enough stock to hold")
+        self.available = available  # {variant_id: stock} for every short variant
+
+
+def _per_variant(quantities):
+    return Case(*[When(pk=pk, then=quantity) for pk, quantity in quantities.items()], output_field=IntegerField())
+
+
+def _stock_changed(product_ids, variant_ids):
+    catalog.schedule_refresh(set(product_ids), stock_only=True)
+    catalog.invalidate_stock(list(variant_ids))
+
+
+def reserve(lines, minutes=None, owner="", reference=None):
+    """
+    Hold stock for `lines`, an iterable of (variant, quantity). All or
+    nothing: raises InsufficientStock, holding nothing, when any variant is
+    short. Returns a Hold with the reference to pass to convert()/release()
+    and the time the checkout session should expire.
+
+    The `owner`, a signed-in buyer's Clerk id, is recorded so a later
+    checkout can find the hold again (see held_by()).
+
+    A retried checkout passes the `reference` of its first attempt: if that
+    hold still stands it is returned unchanged, expiry included, so the
+    retry sends Stripe the same parameters.
+    """
+    if reference is not None:
+        held_until = StockReservation.objects.filter(reference=reference).values_list('expires_at', flat=True).first()
+        if held_until is not None:
+            return Hold(reference, held_until - WEBHOOK_GRACE)
+    quantities = Counter()
+    products = {}
+    for variant, quantity in lines:
+        quantities[variant.pk] += quantity
+        products[variant.pk] = variant.product_id
+    expires_at = timezone.now() + timedelta(minutes=minutes or settings.STOCK_HOLD_MINUTES)
+    reference = reference or uuid.uuid4()
+
+    try:
+        with transaction.atomic():
+            needed = _per_variant(quantities)
+            taken = ProductVariant.objects.filter(pk__in=quantities, stock__gte=needed).update(
+                stock=F('stock') - needed, updated_at=Now(),
+            )
+            if taken < len(quantities):
+                raise InsufficientStock({})  # rolls back the partial UPDATE
+            StockReservation.objects.bulk_create(
+                StockReservation(
+                    reference=reference, owner=owner, variant_id=pk, quantity=quantity,
+                    expires_at=expires_at + WEBHOOK_GRACE,
+                )
+                for pk, quantity in quantities.items()
+            )
+            _stock_changed(products.values(), quantities)
+    except InsufficientStock as short:
+        # Someone got there first; report what's left now nothing is held.
+        stock = dict(ProductVariant.objects.filter(pk__in=quantities).values_list('id', 'stock'))
+        short.available = {
+            pk: stock.get(pk, 0) for pk, quantity in quantities.items() if stock.get(pk, 0) < quantity
+        }
+        raise
+    return Hold(reference, expires_at)
+
+
+def attach_session(reference, session_id):
+    """Record the Stripe checkout session created for a hold."""
+    StockReservation.objects.filter(reference=reference).update(checkout_session=session_id)
+
+
+def held_by(owner, exclude=None):
+    """
+    Return {reference: checkout session id} for `owner`'s holds other than
+    `exclude`. The session id is blank while the session isn't created yet.
+    """
+    holds = StockReservation.objects.filter(owner=owner)
+    if exclude is not None:
+        holds = holds.exclude(reference=exclude)
+    return dict(holds.values_list('reference', 'checkout_session').distinct())
+
+
+def _held(reference):
+    # References come back from Stripe metadata as strings, possibly blank.
+    try:
+        return StockReservation.objects.filter(reference=uuid.UUID(str(reference)))
+    except ValueError:
+        return StockReservation.objects.none()
+
+
+def _end(reservations, restock):
+    """Delete the given reservations, returning their units to stock if `restock`."""
+    with transaction.atomic():
+        held = list(reservations.select_for_update(of=('self',)).values_list('id', 'variant_id', 'variant__product_id', 'quantity'))
+        if not held:
+            return {}
+        quantities = Counter()
+        for _, variant_id, _, quantity in held:
+            quantities[variant_id] += quantity
+        StockReservation.objects.filter(id__in=[row[0] for row in held]).delete()
+        if restock:
+            ProductVariant.objects.filter(pk__in=quantities).update(
+                stock=F('stock') + _per_variant(quantities), updated_at=Now(),
+            )
+            _stock_changed([row[2] for row in held], quantities)
+    return dict(quantities)
+
+
+def convert(reference):
+    """
+    Turn a hold into a sale. Returns {variant_id: quantity} that was held,
+    or {} when the hold is unknown or already released. Sold units missing
+    from the result, in whole or in part, the caller still has to take
+    (see deduct_stock()).
+    """
+    return _end(_held(reference), restock=False)
+
+
+def release(reference):
+    """Give a hold's units back to stock. Returns {variant_id: quantity} released."""
+    return _end(_held(reference), restock=True)
+
+
+def release_expired(batch_size=1000, now=None):
+    """
+    Release up to `batch_size` holds past their expiry. Returns how many
+    reservation rows the batch looked at, 0 once none are left.
+    """
+    expired = StockReservation.objects.filter(expires_at__lte=now or timezone.now())
+    ids = list(expired.order_by('expires_at').values_list('id', flat=True)[:batch_size])
+    if ids:
+        # Re-checked under the row locks: convert() may have claimed some meanwhile.
+        _end(expired.filter(id__in=ids), restock=True)
+    return len(ids)
+
+
+def deduct_stock(variant, quantity):
+    """Take sold units that were never held, in one UPDATE that can't race below zero."""
+    ProductVariant.objects.filter(pk=variant.pk).update(stock=Greatest(F('stock') - quantity, 0), updated_at=Now())
+    _stock_changed([variant.product_id], [variant.pk])
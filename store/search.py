@@ -0,0 +1,79 @@
+"""
+Full-text product search over name and description.
+
+PostgreSQL: a GIN-indexed ``search_vector`` tsvector column on
+store_product, maintained by a trigger (migration 0024) and ranked with
+ts_rank. Name matches weigh more than description matches.
+
+SQLite (the development fallback in backend/settings.py): an FTS5 table,
+store_product_fts, kept in sync from the Product signals and ranked with
+bm25.
+
+Both match every term of the query as a prefix, so "lot ri" finds
+"Lotus Ring". Any other database falls back to an unindexed icontains scan.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from store.models import Product
+
+MAX_RESULTS = 100
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def search_product_ids(query, limit=20):
+    """Return ids of products matching every term of `query`, best match first."""
+    terms = _terms(query)
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_RESULTS))
+
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        sql = (
+            "SELECT id FROM store_product "
+            "WHERE search_vector @@ to_tsquery('english', %s) "
+            "ORDER BY ts_rank(search_vector, to_tsquery('english', %s)) DESC, id DESC "
+            "LIMIT %s"
+        )
+        params = [tsquery, tsquery, limit]
+    elif connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        sql = (
+            "SELECT rowid FROM store_product_fts "
+            "WHERE store_product_fts MATCH %s "
+            "ORDER BY bm25(store_product_fts, 10.0, 1.0), rowid DESC "
+            "LIMIT %s"
+        )
+        params = [match, limit]
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(description__icontains=term)
+        return list(Product.objects.filter(condition).order_by('-id').values_list('id', flat=True)[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def index_products(products):
+    """Upsert products into the SQLite FTS table (PostgreSQL uses its trigger)."""
+    if connection.vendor != 'sqlite':
+        return
+    rows = [(p.pk, p.name, p.description) for p in products]
+    with connection.cursor() as cursor:
+        cursor.executemany("DELETE FROM store_product_fts WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany("INSERT INTO store_product_fts(rowid, name, description) VALUES (%s, %s, %s)", rows)
+
+
+def unindex_products(product_ids):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany("DELETE FROM store_product_fts WHERE rowid = %s", [(pk,) for pk in product_ids])
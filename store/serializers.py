@@ -26,7 +26,20 @@ class ProductVariantSerializer(serializers.ModelSerializer):
         model = ProductVariant
         fields = ['id', 'size', 'stock', 'product']
 
-class ProductSerializer(serializers.ModelSerializer):
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    A ModelSerializer that takes an additional `fields` argument that
+    controls which fields should be displayed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+class ProductSerializer(DynamicFieldsModelSerializer):
     category = CategorySerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     variants = ProductVariantSerializer(many=True, read_only=True)
@@ -44,6 +57,24 @@ class ProductSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+class ProductCardSerializer(serializers.ModelSerializer):
+    """Grid/card projection; expects `in_stock` from ProductQuerySet.for_card()."""
+    image_url = serializers.SerializerMethodField()
+    in_stock = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'image_url', 'in_stock']
+
+    get_image_url = ProductSerializer.get_image_url
+
+def nested_product(serializer, product):
+    """ProductSerializer output for `product`, built once per product per response."""
+    memo = serializer.context.setdefault('product_memo', {})
+    if product.pk not in memo:
+        memo[product.pk] = ProductSerializer(product, context=serializer.context).data
+    return memo[product.pk]
+
 class CartItemSerializer(serializers.ModelSerializer):
     variant = ProductVariantSerializer(read_only=True)
     product = serializers.SerializerMethodField()
@@ -53,7 +84,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'variant', 'product', 'quantity']
 
     def get_product(self, obj):
-        return ProductSerializer(obj.variant.product, context=self.context).data if obj.variant else None
+        return nested_product(self, obj.variant.product) if obj.variant else None
 
 
 class CartItemCreateSerializer(serializers.ModelSerializer):
@@ -66,6 +97,18 @@ class CartItemCreateSerializer(serializers.ModelSerializer):
         fields = ['variant', 'quantity']
 
 
+class CartBatchItemSerializer(serializers.Serializer):
+    # `variant` is a plain id: the view resolves the whole batch with one in_bulk().
+    variant = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, default=1)
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'], default='add')
+
+
+class CartBatchSerializer(serializers.Serializer):
+    clerk_user_id = serializers.CharField(required=False, allow_blank=True)
+    items = CartBatchItemSerializer(many=True, allow_empty=False)
+
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
 
@@ -82,7 +125,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'variant', 'product', 'quantity', 'price']
 
     def get_product(self, obj):
-        return ProductSerializer(obj.variant.product, context=self.context).data if obj.variant else None
+        return nested_product(self, obj.variant.product) if obj.variant else None
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -0,0 +1,41 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from store import catalog, search
+from store.models import Category, Product, ProductImage, ProductVariant
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    catalog.schedule_refresh([instance.pk])
+    search.index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    catalog.schedule_refresh([instance.pk])
+    search.unindex_products([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=ProductImage)
+def product_child_changed(sender, instance, **kwargs):
+    catalog.schedule_refresh([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def variant_stock_changed(sender, instance, **kwargs):
+    catalog.invalidate_stock([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    catalog.invalidate_state()
+    catalog.schedule_refresh(Product.objects.filter(category=instance).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # Products are detached (SET_NULL) before post_delete fires, so collect them now.
+    catalog.invalidate_state()
+    catalog.schedule_refresh(Product.objects.filter(category=instance).values_list('pk', flat=True))
@@ -1,3 +1,1460 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import nullcontext
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+import cloudinary
+import jwt
+import requests
+import stripe
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core import mail
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework.exceptions import AuthenticationFailed, ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from shippo import Shippo
+from backend import outbound
+from backend.clerk_auth import ClerkAuthentication
+from backend.renderers import FastJSONParser, FastJSONRenderer
+from store.carts import add_to_cart, guest_cart_id, merge_guest_cart, upsert_cart
+from store.fast_serializers import cart_item_reader, order_reader, product_reader
+from store.middleware import ClerkUserMiddleware, CompressionMiddleware, brotli
+from store import catalog, jobs, reservations
+from store.models import (
+    Cart, CartItem, Category, Job, Order, OrderItem, Product, ProductImage, ProductVariant, StockReservation,
+)
+from store.serializers import CartItemSerializer, OrderSerializer, ProductSerializer
+
+
+def make_product(category=None, name="Lotus Ring", price="25.00", sizes=("6", "7"), stock=3, images=1):
+    product = Product.objects.create(
+        name=name,
+        description=f"{name} in sterling silver",
+        image="buddhabasha/sample.jpg",
+        price=price,
+        category=category,
+    )
+    for size in sizes:
+        ProductVariant.objects.create(product=product, size=size, stock=stock)
+    for i in range(images):
+        ProductImage.objects.create(product=product, image=f"buddhabasha/extra_{i}.jpg", alt_text=name)
+    return product
+
+
+class StoreTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cloudinary.config(cloud_name="test-cloud")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Rings", slug="rings")
+
+
+class ProductQueryBudgetTests(StoreTestCase):
+    # Cold: catalog state (newest product/variant change) + page keys +
+    # products/categories/images/variants for the cache misses.
+    # Warm: page keys only.
+    STATE_QUERIES = 2
+    LIST_BUDGET = STATE_QUERIES + 5
+    LIST_CACHED_BUDGET = 1
+    DETAIL_BUDGET = STATE_QUERIES + 4
+
+    def test_list_query_count_is_constant(self):
+        for i in range(2):
+            make_product(self.category, name=f"Ring {i}")
+        with self.assertNumQueries(self.LIST_BUDGET):
+            small = self.client.get("/store/products/")
+
+        for i in range(2, 20):
+            make_product(self.category, name=f"Ring {i}", images=3)
+        with self.assertNumQueries(self.LIST_BUDGET):
+            large = self.client.get("/store/products/")
+        with self.assertNumQueries(self.LIST_CACHED_BUDGET):
+            self.client.get("/store/products/")
+
+        self.assertEqual(small.status_code, 200)
+        self.assertEqual(len(large.json()["results"]), 20)
+
+    def test_detail_query_count(self):
+        product = make_product(self.category)
+        with self.assertNumQueries(self.DETAIL_BUDGET):
+            response = self.client.get(f"/store/products/{product.id}/")
+        with self.assertNumQueries(0):
+            self.client.get(f"/store/products/{product.id}/")
+        body = response.json()
+        self.assertEqual(body["category"]["slug"], "rings")
+        self.assertEqual(len(body["variants"]), 2)
+        self.assertEqual(len(body["images"]), 1)
+
+
+class CursorPaginationTests(StoreTestCase):
+    def test_walk_is_stable_under_inserts(self):
+        created = [make_product(self.category, name=f"Ring {i}").id for i in range(12)]
+        seen = []
+        url = "/store/products/?page_size=5"
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                body = self.client.get(url).json()
+            self.assertLessEqual(len(queries), ProductQueryBudgetTests.LIST_BUDGET)
+            seen.extend(p["id"] for p in body["results"])
+            if len(seen) == 5:
+                # A product added mid-walk lands ahead of the cursor.
+                make_product(self.category, name="New arrival")
+            url = body["next"]
+        self.assertEqual(seen, sorted(created, reverse=True))
+
+    def test_page_size_is_capped(self):
+        make_product(self.category)
+        response = self.client.get("/store/products/?page_size=1000")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()["next"])
+
+
+class CatalogSnapshotTests(StoreTestCase):
+    def test_snapshot_matches_serializer(self):
+        product = make_product(self.category)
+        response = self.client.get(f"/store/products/{product.id}/")
+        expected = ProductSerializer(Product.objects.for_catalog().get(pk=product.pk)).data
+        self.assertEqual(response.json(), json.loads(json.dumps(expected)))
+
+    def test_edits_invalidate_and_rebuild_on_commit(self):
+        product = make_product(self.category)
+        self.client.get(f"/store/products/{product.id}/")
+
+        variant = product.variants.first()
+        variant.stock = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            variant.save()
+        with self.assertNumQueries(ProductQueryBudgetTests.STATE_QUERIES):
+            body = self.client.get(f"/store/products/{product.id}/").json()
+        self.assertEqual(body["variants"][0]["stock"], 0)
+
+        self.category.name = "Fine Rings"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        self.assertEqual(self.client.get(f"/store/products/{product.id}/").json()["category"]["name"], "Fine Rings")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.client.get(f"/store/products/{product.id}/").status_code, 404)
+
+
+class ConditionalGetTests(StoreTestCase):
+    def test_product_list_revalidates_until_catalog_changes(self):
+        product = make_product(self.category)
+        first = self.client.get("/store/products/")
+        self.assertIn("ETag", first)
+        self.assertIn("Last-Modified", first)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get("/store/products/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+        other_page = self.client.get("/store/products/?page_size=1")
+        self.assertNotEqual(other_page["ETag"], first["ETag"])
+
+        variant = product.variants.first()
+        variant.stock = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            variant.save()
+        changed = self.client.get("/store/products/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+
+    def test_category_list_revalidates(self):
+        first = self.client.get("/store/categories/")
+        cached = self.client.get("/store/categories/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Necklaces", slug="necklaces")
+        changed = self.client.get("/store/categories/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.json()), 2)
+
+    def test_representations_have_their_own_etags(self):
+        html = self.client.get("/store/categories/", HTTP_ACCEPT="text/html")
+        self.assertEqual(html["Content-Type"], "text/html; charset=utf-8")
+        self.assertIn("Accept", html["Vary"])
+        json_response = self.client.get("/store/categories/", HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=html["ETag"])
+        self.assertEqual(json_response.status_code, 200)
+        self.assertEqual(json_response["Content-Type"], "application/json")
+        self.assertNotEqual(json_response["ETag"], html["ETag"])
+
+
+class ProductSearchTests(StoreTestCase):
+    def test_prefix_match_ranks_name_above_description(self):
+        by_description = Product.objects.create(
+            name="Chain", description="Pairs well with a lotus charm", image="buddhabasha/a.jpg", price="10.00"
+        )
+        by_name = make_product(self.category, name="Lotus Ring")
+        make_product(self.category, name="Moon Pendant")
+
+        body = self.client.get("/store/products/search/?q=lot").json()
+        self.assertEqual([p["id"] for p in body["results"]], [by_name.id, by_description.id])
+
+        body = self.client.get("/store/products/search/?q=lotus rin").json()
+        self.assertEqual([p["id"] for p in body["results"]], [by_name.id])
+
+    def test_index_follows_edits_and_deletes(self):
+        product = make_product(self.category, name="Lotus Ring")
+        product.name = "Sun Ring"
+        product.description = "Sterling silver"
+        product.save()
+        self.assertEqual(self.client.get("/store/products/search/?q=lotus").json()["results"], [])
+        self.assertEqual(len(self.client.get("/store/products/search/?q=sun").json()["results"]), 1)
+
+        product.delete()
+        self.assertEqual(self.client.get("/store/products/search/?q=sun").json()["results"], [])
+
+    def test_empty_query(self):
+        make_product(self.category)
+        self.assertEqual(self.client.get("/store/products/search/?q=%20").json(), {"results": []})
+
+
+class ProductFilterTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        necklaces = Category.objects.create(name="Necklaces", slug="necklaces")
+        self.ring = make_product(self.category, name="Lotus Ring", price="25.00", sizes=("6", "7"))
+        self.sold_out = make_product(self.category, name="Moon Ring", price="40.00", sizes=("7",), stock=0)
+        self.necklace = make_product(necklaces, name="Om Necklace", price="60.00", sizes=("18in",))
+
+    def ids(self, query):
+        return {p["id"] for p in self.client.get(f"/store/products/?{query}").json()["results"]}
+
+    def test_filters(self):
+        self.assertEqual(self.ids("category=rings"), {self.ring.id, self.sold_out.id})
+        self.assertEqual(self.ids("size=7"), {self.ring.id, self.sold_out.id})
+        self.assertEqual(self.ids("size=7&in_stock=true"), {self.ring.id})
+        self.assertEqual(self.ids("size=6,18in"), {self.ring.id, self.necklace.id})
+        self.assertEqual(self.ids("min_price=30&max_price=60"), {self.sold_out.id, self.necklace.id})
+
+    def test_invalid_price(self):
+        self.assertEqual(self.client.get("/store/products/?min_price=cheap").status_code, 400)
+
+    def test_facets_in_one_query(self):
+        with self.assertNumQueries(1):
+            facets = self.client.get("/store/products/facets/").json()
+        self.assertEqual(facets, {
+            "category": {"rings": 2, "necklaces": 1},
+            "size": {"6": 1, "7": 2, "18in": 1},
+            "in_stock": 2,
+        })
+
+        facets = self.client.get("/store/products/facets/?category=rings").json()
+        self.assertEqual(facets, {"category": {"rings": 2}, "size": {"6": 1, "7": 2}, "in_stock": 1})
+
+
+class SparseFieldsetTests(StoreTestCase):
+    def test_card_view(self):
+        product = make_product(self.category, name="Lotus Ring")
+        make_product(self.category, name="Moon Ring", stock=0)
+        with self.assertNumQueries(ProductQueryBudgetTests.STATE_QUERIES + 1):
+            body = self.client.get("/store/products/?view=card").json()
+        cards = {card["id"]: card for card in body["results"]}
+        self.assertEqual(set(cards[product.id]), {"id", "name", "price", "image_url", "in_stock"})
+        self.assertEqual(sorted(card["in_stock"] for card in cards.values()), [False, True])
+
+    def test_fields_skip_unrequested_relations(self):
+        product = make_product(self.category)
+        self.client.get("/store/products/")  # warm the catalog state
+        with CaptureQueriesContext(connection) as queries:
+            body = self.client.get(f"/store/products/{product.id}/?fields=id,name,variants").json()
+        self.assertEqual(set(body), {"id", "name", "variants"})
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn("description", queries[0]["sql"])
+
+    def test_fields_load_every_requested_column(self):
+        for i in range(5):
+            Product.objects.filter(pk=make_product(self.category, name=f"Ring {i}").pk).update(sku=f"R-{i}")
+        self.client.get("/store/products/")  # warm the catalog state
+        with self.assertNumQueries(1):
+            body = self.client.get("/store/products/?fields=id,sku").json()
+        self.assertEqual(sorted(product["sku"] for product in body["results"]), [f"R-{i}" for i in range(5)])
+
+    def test_omit(self):
+        product = make_product(self.category)
+        body = self.client.get(f"/store/products/{product.id}/?omit=images,variants,category").json()
+        self.assertNotIn("variants", body)
+        self.assertEqual(body["name"], product.name)
+
+    def test_unknown_field(self):
+        self.assertEqual(self.client.get("/store/products/?fields=id,secret").status_code, 400)
+        self.assertEqual(self.client.get("/store/products/?view=poster").status_code, 400)
+
+
+class FastSerializerGoldenTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().get("/store/")
+        self.ring = make_product(self.category, name="Lotus Ring", images=2)
+        self.loose = make_product(None, name="Loose Bead", price="3.50", sizes=(None,), images=0)
+        cart = Cart.objects.create(clerk_user_id="user_1")
+        for variant in [*self.ring.variants.all(), *self.loose.variants.all()]:
+            CartItem.objects.create(cart=cart, variant=variant, quantity=2)
+        self.order = Order.objects.create(
+            clerk_user_id="user_1", email="a@example.com", subtotal="53.50",
+            shipping_address={"line1": "1 Main St"}, stripe_payment_status="paid",
+        )
+        OrderItem.objects.create(order=self.order, variant=self.ring.variants.first(), quantity=2, price="25.00")
+        OrderItem.objects.create(order=self.order, variant=None, quantity=1, price="3.50")
+        Order.objects.create(email="b@example.com", subtotal="0.00")
+
+    def assertGolden(self, fast, slow):
+        self.assertEqual(json.dumps(fast), json.dumps(slow))
+
+    def test_products(self):
+        queryset = Product.objects.for_catalog().order_by("id")
+        slow = ProductSerializer(queryset, many=True, context={"request": self.request}).data
+        fast = product_reader.serialize(product_reader.values(queryset), self.request)
+        self.assertGolden(fast, slow)
+
+    def test_cart_items(self):
+        queryset = CartItem.objects.order_by("id")
+        slow = CartItemSerializer(queryset, many=True, context={"request": self.request}).data
+        with self.assertNumQueries(5):
+            fast = cart_item_reader.serialize(cart_item_reader.values(queryset), self.request)
+        self.assertGolden(fast, slow)
+
+    def test_orders(self):
+        queryset = Order.objects.order_by("id")
+        slow = OrderSerializer(queryset, many=True, context={"request": self.request}).data
+        fast = order_reader.serialize(order_reader.values(queryset), self.request)
+        self.assertGolden(fast, slow)
+
+    def test_cart_items_endpoint(self):
+        body = self.client.get("/store/cart-items/?clerk_user_id=user_1").json()
+        self.assertEqual([item["quantity"] for item in body["results"]], [2, 2, 2])
+        self.assertEqual(body["results"][0]["product"]["name"], "Lotus Ring")
+
+
+class JSONRendererTests(TestCase):
+    def test_matches_drf_output(self):
+        data = {
+            "name": "Lotus Ring\u2028\u00e9",
+            "tags": ["silver", "handmade"],
+            "created_at": timezone.now(),
+            "id": uuid.uuid4(),
+            "nested": [{"stock": 3, "ratio": 0.5, "ok": True, "none": None}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_decimal_keeps_precision(self):
+        self.assertEqual(FastJSONRenderer().render({"price": Decimal("25.10")}), b'{"price":"25.10"}')
+
+    def test_parser_round_trip(self):
+        parsed = FastJSONParser().parse(io.BytesIO(b'{"items": [{"variant": 1, "quantity": 2}]}'))
+        self.assertEqual(parsed, {"items": [{"variant": 1, "quantity": 2}]})
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"items": '))
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionMiddlewareTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        make_product(self.category)
+
+    def test_gzip(self):
+        plain = self.client.get("/store/products/")
+        response = self.client.get("/store/products/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    @skipUnless(brotli, "brotli not installed")
+    def test_brotli_preferred(self):
+        plain = self.client.get("/store/products/")
+        response = self.client.get("/store/products/", HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+    def test_refused_and_small_bodies_pass_through(self):
+        response = self.client.get("/store/products/", HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        with override_settings(COMPRESSION_MIN_SIZE=100000):
+            response = self.client.get("/store/products/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    @patch("store.middleware.compress_string", wraps=compress_string)
+    def test_etagged_responses_compress_once(self, compress):
+        first = self.client.get("/store/products/", HTTP_ACCEPT_ENCODING="gzip")
+        second = self.client.get("/store/products/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertTrue(first["ETag"].startswith('W/"'))
+
+        revalidated = self.client.get("/store/products/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_compressed_cache_is_per_content_type(self):
+        middleware = CompressionMiddleware(lambda request: None)
+        html = HttpResponse(b"<html>" * 200, content_type="text/html")
+        json_body = HttpResponse(b"[]" * 600, content_type="application/json")
+        html["ETag"] = json_body["ETag"] = '"shared"'
+        middleware.compress(html, "gzip")
+        self.assertEqual(gzip.decompress(middleware.compress(json_body, "gzip")), json_body.content)
+
+
+
+class ImportCatalogTests(StoreTestCase):
+    CSV = (
+        "product_sku,name,description,price,image,category_slug,category_name,size,stock\n"
+        "LR-1,Lotus Ring,Sterling lotus,25.00,buddhabasha/lotus.jpg,rings,Rings,6,4\n"
+        "LR-1,Lotus Ring,Sterling lotus,25.00,buddhabasha/lotus.jpg,rings,Rings,7,2\n"
+        "OM-1,Om Pendant,Brass om,18.50,buddhabasha/om.jpg,pendants,Pendants,,9\n"
+    )
+
+    def run_import(self, content, suffix=".csv", *args):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as handle:
+            handle.write(content)
+        self.addCleanup(os.unlink, handle.name)
+        out = io.StringIO()
+        call_command("import_catalog", handle.name, "--batch-size", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_import_then_upsert(self):
+        output = self.run_import(self.CSV)
+        self.assertIn("Imported 3 rows", output)
+        ring = Product.objects.get(sku="LR-1")
+        self.assertEqual(ring.category, self.category)
+        self.assertEqual(dict(ring.variants.values_list("size", "stock")), {"6": 4, "7": 2})
+        self.assertEqual(Category.objects.get(slug="pendants").name, "Pendants")
+
+        self.run_import(self.CSV.replace("Rings,7,2", "Rings,7,0").replace("18.50", "20.00").replace(",,9", ",,1"))
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(ProductVariant.objects.count(), 3)
+        self.assertEqual(ring.variants.get(size="7").stock, 0)
+        pendant = Product.objects.get(sku="OM-1")
+        self.assertEqual(pendant.price, Decimal("20.00"))
+        self.assertEqual(pendant.variants.get().stock, 1)
+
+        body = self.client.get("/store/products/search/?q=pendant").json()
+        self.assertEqual([p["sku"] for p in body["results"]], ["OM-1"])
+
+    def test_jsonl(self):
+        row = {"product_sku": "MB-1", "name": "Mala Bracelet", "price": "30", "size": "M", "stock": 5}
+        self.run_import(json.dumps(row) + "\n", ".jsonl")
+        self.assertEqual(Product.objects.get(sku="MB-1").variants.get().size, "M")
+
+    def test_reads_during_import_are_dropped_on_commit(self):
+        product = make_product(self.category)
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog.invalidate_products([product.id])
+            # A storefront read before the import commits caches the old rows.
+            catalog.get_products_json([product.id])
+            catalog.get_price_data(list(product.variants.select_related("product")))
+        self.assertEqual(cache.get_many([catalog._key(product.id), catalog._price_key(product.id)]), {})
+
+    def test_bad_row(self):
+        with self.assertRaisesMessage(CommandError, "Row 2"):
+            self.run_import(self.CSV.replace("25.00,buddhabasha/lotus.jpg,rings,Rings,7", "cheap,x,rings,Rings,7"))
+
+
+class ExportTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        staff = User.objects.create_user("staff", password="pw", is_staff=True)
+        self.client.force_login(staff)
+        self.ring = make_product(self.category, name="Lotus Ring")
+        order = Order.objects.create(email="a@example.com", subtotal="50.00", stripe_payment_status="paid")
+        OrderItem.objects.create(order=order, variant=self.ring.variants.first(), quantity=2, price="25.00")
+        Order.objects.create(email="b@example.com", subtotal="0.00")
+
+    def stream(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_products_ndjson(self):
+        lines = [json.loads(line) for line in self.stream("/store/admin/export/products/").splitlines()]
+        self.assertEqual([(row["name"], row["size"], row["price"]) for row in lines], [
+            ("Lotus Ring", "6", "25.00"), ("Lotus Ring", "7", "25.00"),
+        ])
+
+    def test_orders_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.stream("/store/admin/export/orders/?format=csv"))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual((rows[0]["product_name"], rows[0]["quantity"], rows[0]["unit_price"]), ("Lotus Ring", "2", "25.00"))
+        self.assertEqual(rows[1]["item_id"], "")
+
+    def test_date_range(self):
+        tomorrow = (timezone.now() + timedelta(days=1)).date().isoformat()
+        self.assertEqual(self.stream(f"/store/admin/export/orders/?since={tomorrow}"), "")
+        self.assertEqual(self.client.get("/store/admin/export/orders/?since=yesterday").status_code, 400)
+
+    def test_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get("/store/admin/export/orders/").status_code, 302)
+
+
+class StockViewTests(StoreTestCase):
+    def test_get_and_post(self):
+        product = make_product(self.category, stock=4)
+        ids = list(product.variants.values_list("id", flat=True))
+        with self.assertNumQueries(1):
+            body = self.client.get(f"/store/stock/?ids={ids[0]},{ids[1]},999999").json()
+        self.assertEqual(body, {str(ids[0]): 4, str(ids[1]): 4})
+
+        with self.assertNumQueries(0):
+            body = self.client.post("/store/stock/", {"ids": ids}, format="json").json()
+        self.assertEqual(body, {str(ids[0]): 4, str(ids[1]): 4})
+
+    def test_variant_save_clears_cached_level(self):
+        variant = make_product(self.category, stock=4).variants.first()
+        self.client.get(f"/store/stock/?ids={variant.id}")
+        variant.stock = 1
+        variant.save()
+        self.assertEqual(self.client.get(f"/store/stock/?ids={variant.id}").json(), {str(variant.id): 1})
+
+    def test_bad_ids(self):
+        self.assertEqual(self.client.get("/store/stock/?ids=1,abc").status_code, 400)
+        self.assertEqual(self.client.get("/store/stock/?ids=" + ",".join(map(str, range(300)))).status_code, 400)
+
+
+class CartQueryBudgetTests(StoreTestCase):
+    # cart + items (variant, product, category joined) + images + variants
+    CART_BUDGET = 4
+
+    def fill_cart(self, lines):
+        cart, _ = Cart.objects.get_or_create(clerk_user_id="user_1")
+        for i in range(lines):
+            product = make_product(self.category, name=f"Ring {cart.items.count()}", sizes=("7",))
+            CartItem.objects.create(cart=cart, variant=product.variants.get(), quantity=1)
+
+    def test_cart_is_constant_queries(self):
+        self.fill_cart(2)
+        with self.assertNumQueries(self.CART_BUDGET):
+            self.client.get("/store/cart/?clerk_user_id=user_1")
+        self.fill_cart(8)
+        with self.assertNumQueries(self.CART_BUDGET):
+            body = self.client.get("/store/cart/?clerk_user_id=user_1").json()
+        self.assertEqual(len(body[0]["items"]), 10)
+
+    def test_cart_item_detail(self):
+        self.fill_cart(1)
+        item = CartItem.objects.get()
+        with self.assertNumQueries(3):
+            body = self.client.get(f"/store/cart-items/{item.id}/?clerk_user_id=user_1").json()
+        self.assertEqual(body["product"]["variants"][0]["id"], item.variant_id)
+
+    def test_nested_product_is_memoized(self):
+        product = make_product(self.category, sizes=("6", "7"))
+        cart = Cart.objects.create(clerk_user_id="user_1")
+        for variant in product.variants.all():
+            CartItem.objects.create(cart=cart, variant=variant, quantity=1)
+        with patch("store.serializers.ProductSerializer", wraps=ProductSerializer) as serializer:
+            self.client.get("/store/cart/?clerk_user_id=user_1")
+        self.assertEqual(serializer.call_count, 1)
+
+
+class CartBatchTests(StoreTestCase):
+    url = "/store/cart-items/batch/"
+
+    def setUp(self):
+        super().setUp()
+        self.ring = make_product(self.category, name="Ring", sizes=("6", "7"), stock=3)
+        self.six, self.seven = self.ring.variants.order_by("size")
+        self.cart = Cart.objects.create(clerk_user_id="user_1")
+        CartItem.objects.create(cart=self.cart, variant=self.six, quantity=1)
+
+    def post(self, items):
+        return self.client.post(self.url, {"clerk_user_id": "user_1", "items": items}, format="json")
+
+    def test_applies_every_op(self):
+        bracelet = make_product(self.category, name="Bracelet", sizes=("M",)).variants.get()
+        response = self.post([
+            {"variant": self.six.id, "quantity": 2},
+            {"variant": self.seven.id, "quantity": 3, "op": "set"},
+            {"variant": bracelet.id, "op": "add"},
+        ])
+        self.assertEqual(response.status_code, 200)
+        quantities = {item["variant"]["id"]: item["quantity"] for item in response.json()["items"]}
+        self.assertEqual(quantities, {self.six.id: 3, self.seven.id: 3, bracelet.id: 1})
+
+        response = self.post([{"variant": self.six.id, "op": "remove"}, {"variant": self.seven.id, "quantity": 0, "op": "set"}])
+        self.assertEqual([item["variant"]["id"] for item in response.json()["items"]], [bracelet.id])
+
+    def test_query_count_is_constant(self):
+        variants = [make_product(self.category, name=f"Charm {i}", sizes=("M",)).variants.get() for i in range(10)]
+        with CaptureQueriesContext(connection) as small:
+            self.post([{"variant": variants[0].id}])
+        with CaptureQueriesContext(connection) as large:
+            self.post([{"variant": variant.id} for variant in variants[1:]])
+        self.assertEqual(len(small), len(large))
+
+    def test_racing_insert_reruns_batch(self):
+        bracelet = make_product(self.category, name="Bracelet", sizes=("M",)).variants.get()
+        bulk_create = CartItem.objects.bulk_create
+        calls = []
+
+        def concurrent_bulk_create(objs, *args, **kwargs):
+            calls.append(objs)
+            if len(calls) == 1:
+                # A single add of the same new variant commits between our read and insert.
+                CartItem(cart=self.cart, variant=bracelet, quantity=1).save()
+                raise IntegrityError("unique_cart_item_variant")
+            return bulk_create(objs, *args, **kwargs)
+
+        # Without the savepoint the competing row survives the IntegrityError.
+        with patch.object(CartItem.objects, "bulk_create", side_effect=concurrent_bulk_create), \
+                patch("store.views.cart.transaction.atomic", lambda *args, **kwargs: nullcontext()):
+            response = self.post([{"variant": bracelet.id, "quantity": 2}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.cart.items.get(variant=bracelet).quantity, 3)
+
+    def test_rejects_whole_batch(self):
+        response = self.post([
+            {"variant": self.seven.id, "quantity": 1},
+            {"variant": self.six.id, "quantity": 3},
+            {"variant": 999999},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["items"]
+        self.assertEqual(errors[0], {})
+        self.assertIn("quantity", errors[1])
+        self.assertIn("variant", errors[2])
+        self.assertEqual(list(self.cart.items.values_list("variant_id", "quantity")), [(self.six.id, 1)])
+
+
+class CleanCartStockTests(StoreTestCase):
+    url = "/store/clean-cart-stock/"
+
+    def fill_cart(self, cart, lines):
+        for i in range(lines):
+            sold_out = make_product(self.category, name=f"Sold out {i}", sizes=("6",), stock=0).variants.get()
+            low = make_product(self.category, name=f"Low {i}", sizes=("6",), stock=2).variants.get()
+            plenty = make_product(self.category, name=f"Plenty {i}", sizes=("6",), stock=9).variants.get()
+            CartItem.objects.create(cart=cart, variant=sold_out, quantity=1)
+            CartItem.objects.create(cart=cart, variant=low, quantity=5)
+            CartItem.objects.create(cart=cart, variant=plenty, quantity=5)
+
+    def test_report_and_cart(self):
+        cart = Cart.objects.create(clerk_user_id="user_1")
+        self.fill_cart(cart, 2)
+        body = self.client.post(self.url, {"clerk_user_id": "user_1"}, format="json").json()
+        self.assertEqual(body["removed"], [
+            {"product": "Sold out 0", "reason": "out_of_stock"},
+            {"product": "Sold out 1", "reason": "out_of_stock"},
+        ])
+        self.assertEqual(body["adjusted"], [
+            {"product": "Low 0", "adjusted_to": 2, "reason": "reduced_to_match_stock"},
+            {"product": "Low 1", "adjusted_to": 2, "reason": "reduced_to_match_stock"},
+        ])
+        self.assertEqual(
+            sorted(cart.items.values_list("variant__product__name", "quantity")),
+            [("Low 0", 2), ("Low 1", 2), ("Plenty 0", 5), ("Plenty 1", 5)],
+        )
+
+    def test_query_count_is_constant(self):
+        small = Cart.objects.create(clerk_user_id="user_1")
+        large = Cart.objects.create(clerk_user_id="user_2")
+        self.fill_cart(small, 1)
+        self.fill_cart(large, 6)
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.post(self.url, {"clerk_user_id": "user_1"}, format="json")
+        with CaptureQueriesContext(connection) as large_queries:
+            self.client.post(self.url, {"clerk_user_id": "user_2"}, format="json")
+        self.assertEqual(len(small_queries), len(large_queries))
+
+
+class GuestCartMergeTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ring = make_product(self.category, name="Ring", sizes=("6", "7"), stock=3)
+        self.six, self.seven = self.ring.variants.order_by("size")
+        self.guest = Cart.objects.create(clerk_user_id="guest_abc")
+        CartItem.objects.create(cart=self.guest, variant=self.six, quantity=2)
+        CartItem.objects.create(cart=self.guest, variant=self.seven, quantity=1)
+
+    def test_sums_quantities_capped_at_stock(self):
+        cart = Cart.objects.create(clerk_user_id="user_1")
+        CartItem.objects.create(cart=cart, variant=self.six, quantity=2)
+        self.assertEqual(merge_guest_cart("guest_abc", "user_1"), cart)
+        self.assertEqual(
+            sorted(cart.items.values_list("variant_id", "quantity")),
+            [(self.six.id, 3), (self.seven.id, 1)],
+        )
+        self.assertFalse(Cart.objects.filter(clerk_user_id="guest_abc").exists())
+
+    def test_guest_cart_changes_hands_without_user_cart(self):
+        cart = merge_guest_cart("guest_abc", "user_1")
+        self.assertEqual(cart.pk, self.guest.pk)
+        self.assertEqual(cart.items.count(), 2)
+        self.assertIsNone(merge_guest_cart("guest_missing", "user_1"))
+
+    def test_merged_once_on_first_authenticated_request(self):
+        request = RequestFactory().get("/store/cart/", HTTP_AUTHORIZATION="Bearer token")
+        request.session = SessionStore()
+        request.session.create()
+        Cart.objects.filter(pk=self.guest.pk).update(clerk_user_id=guest_cart_id(request.session.session_key))
+        middleware = ClerkUserMiddleware(lambda request: None)
+        middleware.jwks = {"keys": [{"kid": "key"}]}
+        with patch("store.middleware.jwt") as jwt:
+            jwt.get_unverified_header.return_value = {"kid": "key"}
+            jwt.decode.return_value = {"sub": "user_1"}
+            middleware(request)
+            with patch("store.middleware.merge_guest_cart") as merge:
+                middleware(request)
+        merge.assert_not_called()
+        self.assertEqual(Cart.objects.get().clerk_user_id, "user_1")
+
+    def test_failed_merge_is_reported_and_retried(self):
+        request = RequestFactory().get("/store/cart/", HTTP_AUTHORIZATION="Bearer token")
+        request.session = SessionStore()
+        request.session.create()
+        middleware = ClerkUserMiddleware(lambda request: request.clerk_user_id)
+        middleware.jwks = {"keys": [{"kid": "key"}]}
+        with patch("store.middleware.jwt") as jwt, patch("builtins.print") as log:
+            jwt.get_unverified_header.return_value = {"kid": "key"}
+            jwt.decode.return_value = {"sub": "user_1"}
+            with patch("store.middleware.merge_guest_cart", side_effect=OperationalError("database is locked")):
+                self.assertEqual(middleware(request), "user_1")
+            self.assertIn("Guest cart merge error", log.call_args.args[0])
+            with patch("store.middleware.merge_guest_cart") as merge:
+                middleware(request)
+        merge.assert_called_once()
+
+
+class PurgeCartsTests(StoreTestCase):
+    def test_purges_idle_carts_and_expired_sessions(self):
+        variant = make_product(self.category, sizes=("6",)).variants.get()
+        for i in range(5):
+            cart = Cart.objects.create(clerk_user_id=f"guest_{i}")
+            CartItem.objects.create(cart=cart, variant=variant, quantity=1)
+        Cart.objects.update(updated_at=timezone.now() - timedelta(days=45))
+        fresh = Cart.objects.create(clerk_user_id="user_1")
+
+        expired = SessionStore()
+        expired.set_expiry(-60)
+        expired.create()
+        live = SessionStore()
+        live.create()
+
+        out = io.StringIO()
+        call_command("purge_carts", "--days", "30", "--batch-size", "2", stdout=out)
+        output = out.getvalue()
+        self.assertEqual(list(Cart.objects.all()), [fresh])
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(output.count("carts batch"), 3)
+        self.assertIn("Purged 5 carts and 1 sessions", output)
+        self.assertTrue(SessionStore().exists(live.session_key))
+        self.assertFalse(SessionStore().exists(expired.session_key))
+
+    def test_cart_edits_keep_it_alive(self):
+        variant = make_product(self.category, sizes=("6",)).variants.get()
+        cart = Cart.objects.create(clerk_user_id="user_1")
+        Cart.objects.update(updated_at=timezone.now() - timedelta(days=45))
+        self.client.post("/store/cart-items/batch/", {"clerk_user_id": "user_1", "items": [{"variant": variant.id}]}, format="json")
+        call_command("purge_carts", stdout=io.StringIO())
+        self.assertTrue(Cart.objects.filter(pk=cart.pk).exists())
+
+
+
+class HotQueryPlanTests(StoreTestCase):
+    """
+    EXPLAIN each hot lookup on a seeded dataset and fail on a full table
+    scan. PostgreSQL has sequential scans priced out so a small test table
+    can't hide a missing index; SQLite plans from the schema alone.
+    """
+
+    def setUp(self):
+        super().setUp()
+        products = Product.objects.bulk_create(
+            Product(name=f"Charm {i}", description="", image="buddhabasha/x.jpg", price="5.00", category=self.category)
+            for i in range(100)
+        )
+        ProductVariant.objects.bulk_create(ProductVariant(product=product, size="7", stock=1) for product in products)
+        Cart.objects.bulk_create(Cart(clerk_user_id=f"guest_{i}") for i in range(200))
+        Order.objects.bulk_create(
+            Order(clerk_user_id=f"user_{i % 20}" if i % 3 else f"guest_{i}", email=f"buyer{i % 50}@example.com", subtotal="5.00")
+            for i in range(200)
+        )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == "postgresql":
+            scans = re.findall(r"Seq Scan on (\w+)", plan)
+        else:
+            scans = re.findall(r"\bSCAN (\w+)", plan)
+        self.assertEqual(scans, [], plan)
+
+    def test_cart_lookups(self):
+        self.assertNoFullScan(Cart.objects.filter(clerk_user_id="guest_7"))
+        self.assertNoFullScan(CartItem.objects.filter(cart__clerk_user_id="guest_7").with_products())
+        self.assertNoFullScan(Cart.objects.filter(updated_at__lt=timezone.now()).order_by("updated_at").values_list("id"))
+
+    def test_order_lookups(self):
+        self.assertNoFullScan(Order.objects.filter(clerk_user_id="user_3").order_by("-created_at", "-id"))
+        self.assertNoFullScan(Order.objects.filter(email="buyer3@example.com", clerk_user_id__startswith="guest_"))
+
+    def test_variant_matching(self):
+        self.assertNoFullScan(ProductVariant.objects.filter(product__name__in=["Charm 3", "7"], size="7"))
+        self.assertNoFullScan(ProductVariant.objects.filter(product_id=1, size=None))
+
+    def test_cart_owner_is_unique(self):
+        Cart.objects.create(clerk_user_id="user_1")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(clerk_user_id="user_1")
+
+
+class CartUpsertTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.variant = make_product(self.category, sizes=("6",), stock=3).variants.get()
+
+    def test_upsert_cart_reuses_row(self):
+        first = upsert_cart("user_1")
+        Cart.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        with self.assertNumQueries(1):
+            second = upsert_cart("user_1")
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertGreater(Cart.objects.get().updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_add_increments_in_one_statement(self):
+        cart = upsert_cart("user_1")
+        self.assertTrue(add_to_cart(cart.pk, self.variant, 1))
+        with self.assertNumQueries(1):
+            self.assertTrue(add_to_cart(cart.pk, self.variant, 2))
+        self.assertFalse(add_to_cart(cart.pk, self.variant, 1))
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+
+    def test_racing_insert_becomes_increment(self):
+        cart = upsert_cart("user_1")
+
+        def concurrent_create(**kwargs):
+            # Another request's insert lands between our update and insert.
+            CartItem(cart=cart, variant=self.variant, quantity=1).save()
+            raise IntegrityError("unique_cart_item_variant")
+
+        # Without the savepoint the competing row survives the IntegrityError.
+        with patch.object(CartItem.objects, "create", side_effect=concurrent_create), \
+                patch("store.carts.transaction.atomic", lambda *args, **kwargs: nullcontext()):
+            self.assertTrue(add_to_cart(cart.pk, self.variant, 2))
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+
+    def test_post_twice_sums_quantity(self):
+        for _ in range(2):
+            response = self.client.post("/store/cart-items/", {"clerk_user_id": "user_1", "variant": self.variant.id, "quantity": 1}, format="json")
+            self.assertEqual(response.status_code, 201)
+        response = self.client.post("/store/cart-items/", {"clerk_user_id": "user_1", "variant": self.variant.id, "quantity": 2}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+
+class CheckoutTests(StoreTestCase):
+    url = "/store/create-checkout-session/"
+
+    def checkout(self, items, clerk_user_id="user_1"):
+        with patch("store.views.orders.stripe.checkout.Session.create") as create:
+            create.return_value.id = "cs_test_1"
+            create.return_value.url = "https://checkout.stripe.test/session"
+            response = self.client.post(self.url, {"clerk_user_id": clerk_user_id, "email": "a@example.com", "items": items}, format="json")
+        return response, create
+
+    def test_line_items_use_integer_cents(self):
+        variant = make_product(self.category, name="Ring", price="19.99", sizes=("7",)).variants.get()
+        response, create = self.checkout([{"variant": variant.id, "quantity": 2}])
+        self.assertEqual(response.json(), {"checkout_url": "https://checkout.stripe.test/session"})
+        [line] = create.call_args.kwargs["line_items"]
+        self.assertEqual(line["quantity"], 2)
+        self.assertEqual(line["price_data"]["unit_amount"], 1999)
+        self.assertEqual(line["price_data"]["product_data"]["name"], "Ring - 7")
+
+    # savepoint, conditional stock UPDATE, reservation INSERT, release,
+    # session id UPDATE
+    HOLD_QUERIES = 5
+
+    def test_query_count_is_constant(self):
+        variants = [make_product(self.category, name=f"Charm {i}", sizes=("7",)).variants.get() for i in range(6)]
+        with self.assertNumQueries(2 + self.HOLD_QUERIES):
+            self.checkout([{"variant": variants[0].id, "quantity": 1}], "user_1")
+        with self.assertNumQueries(2 + self.HOLD_QUERIES):
+            self.checkout([{"variant": variant.id, "quantity": 1} for variant in variants], "user_2")
+        with self.assertNumQueries(1 + self.HOLD_QUERIES):
+            self.checkout([{"variant": variant.id, "quantity": 1} for variant in variants], "user_3")
+
+    def test_price_change_invalidates_cached_block(self):
+        product = make_product(self.category, price="10.00", sizes=("7",))
+        variant = product.variants.get()
+        self.checkout([{"variant": variant.id, "quantity": 1}])
+        product.price = Decimal("12.50")
+        product.save()
+        _, create = self.checkout([{"variant": variant.id, "quantity": 1}])
+        self.assertEqual(create.call_args.kwargs["line_items"][0]["price_data"]["unit_amount"], 1250)
+
+    def test_unit_amount_comes_from_loaded_price(self):
+        product = make_product(self.category, price="10.00", sizes=("7",))
+        variant = ProductVariant.objects.select_related("product").get(product=product)
+        catalog.get_price_data([variant])
+        # Another worker edits the price; this worker's cached block is untouched.
+        Product.objects.filter(pk=product.pk).update(price=Decimal("12.50"))
+        variant = ProductVariant.objects.select_related("product").get(pk=variant.pk)
+        [price_data] = catalog.get_price_data([variant]).values()
+        self.assertEqual(price_data["unit_amount"], 1250)
+        self.assertNotIn("unit_amount", cache.get(catalog._price_key(product.id))[variant.id])
+
+    def test_name_read_during_edit_is_dropped_on_commit(self):
+        product = make_product(self.category, name="Ring", sizes=("7",))
+        variant = ProductVariant.objects.select_related("product").get(product=product)
+        catalog.get_price_data([variant])
+        committed = cache.get(catalog._price_key(product.id))
+        product.name = "Lotus Ring"
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+            # A checkout on another connection still sees, and caches, the committed name.
+            cache.set(catalog._price_key(product.id), committed)
+        variant = ProductVariant.objects.select_related("product").get(pk=variant.pk)
+        self.assertEqual(catalog.get_price_data([variant])[variant.id]["product_data"]["name"], "Lotus Ring - 7")
+
+    def test_unknown_variant_and_short_stock(self):
+        variant = make_product(self.category, sizes=("7",), stock=1).variants.get()
+        response, create = self.checkout([{"variant": 999999, "quantity": 1}])
+        self.assertEqual(response.status_code, 400)
+        response, create = self.checkout([{"variant": variant.id, "quantity": 2}])
+        self.assertEqual(response.json()["details"][0]["available"], 1)
+        create.assert_not_called()
+
+
+
+class StockReservationTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.variant = make_product(self.category, name="Ring", sizes=("7",), stock=3).variants.get()
+
+    def stock(self):
+        return ProductVariant.objects.get(pk=self.variant.pk).stock
+
+    def webhook(self, event_type, reservation, quantity=2):
+        event = {"type": event_type, "data": {"object": {
+            "id": "cs_test_1", "payment_status": "paid", "customer_email": "a@example.com",
+            "metadata": {"clerk_user_id": "user_1", "is_guest": "False", "reservation": reservation},
+        }}}
+        line = type("Line", (), {"description": "Ring - 7", "quantity": quantity, "amount_total": 2500 * quantity})
+        with patch("store.views.webhooks.stripe.Webhook.construct_event", return_value=event), \
+                patch("store.fulfillment.stripe.checkout.Session.list_line_items") as list_line_items:
+            list_line_items.return_value.data = [line]
+            response = self.client.post("/store/stripe-webhook/", b"{}", content_type="application/json")
+            call_command("run_worker", "--once", stdout=io.StringIO())
+        return response
+
+    def test_checkout_holds_and_webhook_converts(self):
+        with patch("store.views.orders.stripe.checkout.Session.create") as create:
+            create.return_value.id = "cs_test_1"
+            create.return_value.url = "https://checkout.stripe.test/session"
+            self.client.post("/store/create-checkout-session/", {"clerk_user_id": "user_1", "items": [{"variant": self.variant.id, "quantity": 2}]}, format="json")
+        reference = create.call_args.kwargs["metadata"]["reservation"]
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(StockReservation.objects.get().quantity, 2)
+
+        self.webhook("checkout.session.completed", reference)
+        self.assertEqual(self.stock(), 1)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Order.objects.get().items.get().quantity, 2)
+
+    def test_unheld_sale_is_deducted_once(self):
+        self.webhook("checkout.session.completed", "")
+        self.assertEqual(self.stock(), 1)
+
+    def test_failed_session_releases_hold(self):
+        with patch("store.views.orders.stripe.checkout.Session.create", side_effect=RuntimeError("stripe down")):
+            with self.assertRaises(RuntimeError):
+                self.client.post("/store/create-checkout-session/", {"items": [{"variant": self.variant.id, "quantity": 2}]}, format="json")
+        self.assertEqual(self.stock(), 3)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_partly_held_sale_deducts_the_rest(self):
+        hold = reservations.reserve([(self.variant, 1)])
+        self.webhook("checkout.session.completed", str(hold.reference), quantity=2)
+        self.assertEqual(self.stock(), 1)
+
+    def checkout_as(self, clerk_user_id, session_id, quantity=2, body_user_id=None, expire_error=None):
+        def authenticate(_, request):
+            request.clerk_user_id = clerk_user_id
+            return User.objects.get_or_create(username=clerk_user_id)[0], None
+
+        body = {"clerk_user_id": body_user_id or clerk_user_id, "items": [{"variant": self.variant.id, "quantity": quantity}]}
+        with patch.object(ClerkAuthentication, "authenticate", authenticate if clerk_user_id else lambda *args: None), \
+                patch("store.views.orders.stripe.checkout.Session.create") as create, \
+                patch("store.views.orders.stripe.checkout.Session.expire", side_effect=expire_error) as expire:
+            create.return_value.id = session_id
+            create.return_value.url = "https://checkout.stripe.test/session"
+            response = self.client.post("/store/create-checkout-session/", body, format="json")
+        return response, expire
+
+    def test_new_checkout_expires_buyers_earlier_session(self):
+        self.checkout_as("user_1", "cs_first")
+        reservations.reserve([(self.variant, 1)], owner="user_2")
+        response, expire = self.checkout_as("user_1", "cs_second")
+        self.assertEqual(response.status_code, 200)
+        expire.assert_called_once_with("cs_first")
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(StockReservation.objects.get(owner="user_1").checkout_session, "cs_second")
+
+    def test_earlier_hold_kept_when_session_cannot_be_expired(self):
+        self.checkout_as("user_1", "cs_first", quantity=1)
+        response, _ = self.checkout_as(
+            "user_1", "cs_second", quantity=1, expire_error=stripe.error.InvalidRequestError("session is complete", None),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(StockReservation.objects.filter(owner="user_1").count(), 2)
+
+    def test_unverified_user_id_releases_nothing(self):
+        self.checkout_as("user_1", "cs_first")
+        response, expire = self.checkout_as(None, "cs_other", quantity=1, body_user_id="user_1")
+        self.assertEqual(response.status_code, 200)
+        expire.assert_not_called()
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(StockReservation.objects.get(checkout_session="cs_other").owner, "")
+
+    def test_stock_writes_bump_updated_at(self):
+        ProductVariant.objects.filter(pk=self.variant.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        before = ProductVariant.objects.get(pk=self.variant.pk).updated_at
+        hold = reservations.reserve([(self.variant, 1)])
+        reserved = ProductVariant.objects.get(pk=self.variant.pk).updated_at
+        self.assertGreater(reserved, before)
+        ProductVariant.objects.filter(pk=self.variant.pk).update(updated_at=before)
+        reservations.release(hold.reference)
+        self.assertGreater(ProductVariant.objects.get(pk=self.variant.pk).updated_at, before)
+
+    def test_short_stock_holds_nothing(self):
+        other = make_product(self.category, name="Pendant", sizes=("M",), stock=5).variants.get()
+        with self.assertRaises(reservations.InsufficientStock) as short:
+            reservations.reserve([(other, 2), (self.variant, 2), (self.variant, 2)])
+        self.assertEqual(short.exception.available, {self.variant.id: 3})
+        self.assertEqual(ProductVariant.objects.get(pk=other.pk).stock, 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_session_webhook_releases(self):
+        hold = reservations.reserve([(self.variant, 2)])
+        self.webhook("checkout.session.expired", str(hold.reference))
+        self.assertEqual(self.stock(), 3)
+
+    def test_sweeper_releases_expired_holds(self):
+        reservations.reserve([(self.variant, 1)])
+        live = reservations.reserve([(self.variant, 1)])
+        StockReservation.objects.exclude(reference=live.reference).update(expires_at=timezone.now() - timedelta(minutes=1))
+        out = io.StringIO()
+        call_command("release_stock_holds", "--batch-size", "1", stdout=out)
+        self.assertIn("Released 1 expired holds", out.getvalue())
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(list(StockReservation.objects.values_list("reference", flat=True)), [live.reference])
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    BUYERS = 100
+    STOCK = 10
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cloudinary.config(cloud_name="test-cloud")
+
+    def test_no_oversell_with_parallel_buyers(self):
+        variant = ProductVariant.objects.create(product=make_product(sizes=()), size="7", stock=self.STOCK)
+        start = threading.Barrier(self.BUYERS)
+        outcomes = []
+
+        def buyer():
+            start.wait()
+            try:
+                while True:
+                    try:
+                        reservations.reserve([(variant, 1)])
+                        outcomes.append(True)
+                        return
+                    except reservations.InsufficientStock:
+                        outcomes.append(False)
+                        return
+                    except OperationalError:
+                        # SQLite's shared-cache test database reports lock
+                        # contention instead of waiting; try again.
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer) for _ in range(self.BUYERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), self.BUYERS)
+        self.assertEqual(outcomes.count(True), self.STOCK)
+        self.assertEqual(ProductVariant.objects.get(pk=variant.pk).stock, 0)
+        self.assertEqual(StockReservation.objects.aggregate(held=Sum("quantity"))["held"], self.STOCK)
+
+
+class CheckoutIdempotencyTests(StoreTestCase):
+    url = "/store/create-checkout-session/"
+
+    def setUp(self):
+        super().setUp()
+        self.variant = make_product(self.category, sizes=("7",), stock=5).variants.get()
+        self.body = {"clerk_user_id": "user_1", "items": [{"variant": self.variant.id, "quantity": 1}]}
+
+    def post(self, body=None, key="retry-1"):
+        return self.client.post(self.url, body or self.body, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response(self):
+        with patch("store.views.orders.stripe.checkout.Session.create") as create:
+            create.return_value.id = "cs_test_1"
+            create.return_value.url = "https://checkout.stripe.test/session"
+            first = self.post()
+            with self.assertNumQueries(0):
+                second = self.post()
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(create.call_args.kwargs["idempotency_key"], "checkout-retry-1")
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_key_reused_with_other_body(self):
+        with patch("store.views.orders.stripe.checkout.Session.create") as create:
+            create.return_value.id = "cs_test_1"
+            create.return_value.url = "https://checkout.stripe.test/session"
+            self.post()
+            response = self.post({**self.body, "email": "other@example.com"})
+        self.assertEqual(response.status_code, 422)
+
+    def test_failure_frees_key_and_retry_reuses_hold(self):
+        with patch("store.views.orders.stripe.checkout.Session.create", side_effect=requests.Timeout("read timed out")) as failed:
+            with self.assertRaises(requests.Timeout):
+                self.post()
+        # The call may have reached Stripe, so the hold stays for the retry.
+        self.assertEqual(ProductVariant.objects.get(pk=self.variant.pk).stock, 4)
+        with patch("store.views.orders.stripe.checkout.Session.create") as create:
+            create.return_value.id = "cs_test_1"
+            create.return_value.url = "https://checkout.stripe.test/session"
+            self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(create.call_args.kwargs, failed.call_args.kwargs)
+        self.assertEqual(ProductVariant.objects.get(pk=self.variant.pk).stock, 4)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_in_flight_claim_expires_quickly(self):
+        with patch.object(cache, "add", wraps=cache.add) as add, \
+                patch("store.views.orders.stripe.checkout.Session.create") as create:
+            create.return_value.id = "cs_test_1"
+            create.return_value.url = "https://checkout.stripe.test/session"
+            self.post()
+        self.assertEqual(add.call_args.kwargs["timeout"], settings.IDEMPOTENCY_PENDING_TTL)
+        self.assertLess(settings.IDEMPOTENCY_PENDING_TTL, settings.IDEMPOTENCY_TTL)
+
+    def hold_key(self, *later_entries):
+        # Simulate a first request that has claimed the key and is still running.
+        entries = iter([{"state": "pending", "fingerprint": "same"}, *later_entries])
+        cache_for = patch("store.idempotency._cache").start()
+        cache_for.return_value.add.return_value = False
+        cache_for.return_value.get.side_effect = lambda key: next(entries)
+        patch("store.idempotency._fingerprint", return_value="same").start()
+        self.addCleanup(patch.stopall)
+
+    def test_duplicate_waits_for_in_flight_request(self):
+        self.hold_key({"state": "done", "fingerprint": "same", "status": 200, "data": {"checkout_url": "https://checkout.stripe.test/first"}})
+        with patch("store.idempotency.time.sleep") as sleep, \
+                patch("store.views.orders.stripe.checkout.Session.create") as create:
+            response = self.post()
+        self.assertEqual(response.json(), {"checkout_url": "https://checkout.stripe.test/first"})
+        sleep.assert_called_once()
+        create.assert_not_called()
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_gives_up_on_stuck_request(self):
+        self.hold_key()
+        self.assertEqual(self.post().status_code, 409)
+
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive so the client's connection pool can reuse sockets.
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.server.hits += 1
+        status, delay = self.server.script.pop(0) if self.server.script else (200, 0)
+        time.sleep(delay)
+        body = b'{"ok": true}'
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (timeout tests)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class OutboundHTTPTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.hits = self.server.connections = 0
+        self.server.script = []
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/ping"
+
+    def upstream(self, **config):
+        session = outbound.UpstreamSession("stub", {**outbound.DEFAULTS, "backoff": 0, **config})
+        self.addCleanup(session.close)
+        return session
+
+    def test_reuses_pooled_connection(self):
+        session = self.upstream()
+        for _ in range(5):
+            self.assertEqual(session.get(self.url).json(), {"ok": True})
+        self.assertEqual(self.server.connections, 1)
+
+    def test_read_timeout_is_enforced(self):
+        self.server.script = [(200, 0.5)]
+        session = self.upstream(read_timeout=0.1, retries=0)
+        started = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            session.get(self.url, timeout=60)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_retries_idempotent_requests_only(self):
+        session = self.upstream(retries=2)
+        self.server.script = [(503, 0), (502, 0)]
+        self.assertEqual(session.get(self.url).status_code, 200)
+        self.assertEqual(self.server.hits, 3)
+
+        self.server.script = [(503, 0)]
+        self.assertEqual(session.post(self.url, data="{}").status_code, 503)
+        self.assertEqual(self.server.hits, 4)
+
+        self.server.script = [(503, 0)]
+        self.assertEqual(session.post(self.url, data="{}", headers={"Idempotency-Key": "k"}).status_code, 200)
+        self.assertEqual(self.server.hits, 6)
+
+    def test_retries_stop_at_deadline(self):
+        session = self.upstream(retries=5, connect_timeout=0.1, read_timeout=0.3, deadline=0.7)
+        self.server.script = [(503, 0.2)] * 9
+        self.assertEqual(session.get(self.url).status_code, 503)
+        self.assertEqual(self.server.hits, 2)
+
+        session = self.upstream(retries=0, connect_timeout=0.1, read_timeout=5, deadline=0.3)
+        self.server.script = [(200, 1)]
+        started = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            session.get(self.url)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_local_error_frees_half_open_trial(self):
+        now = [0.0]
+        session = self.upstream(retries=0, failure_threshold=1, reset_timeout=30)
+        session.breaker.clock = lambda: now[0]
+        self.server.script = [(500, 0)]
+        session.get(self.url)
+        now[0] = 31.0
+        with patch("requests.Session.send", side_effect=ValueError("bad body")):
+            with self.assertRaises(ValueError):
+                session.get(self.url)
+        self.assertEqual(session.breaker.state, "half-open")
+        self.assertEqual(session.breaker.failures, 1)
+        self.assertEqual(session.get(self.url).status_code, 200)
+        self.assertEqual(session.breaker.state, "closed")
+
+    def test_circuit_breaker_opens_and_recovers(self):
+        now = [0.0]
+        session = self.upstream(retries=0, failure_threshold=2, reset_timeout=30)
+        session.breaker.clock = lambda: now[0]
+        self.server.script = [(500, 0), (500, 0)]
+        session.get(self.url)
+        session.get(self.url)
+        with self.assertRaises(outbound.CircuitOpenError):
+            session.get(self.url)
+        self.assertEqual(self.server.hits, 2)
+
+        now[0] = 31.0
+        self.assertEqual(session.breaker.state, "half-open")
+        self.assertEqual(session.get(self.url).status_code, 200)
+        self.assertEqual(session.breaker.state, "closed")
+
+    def test_latency_histogram_export(self):
+        outbound.session("stub-metrics").get(self.url)
+        metrics = outbound.render_metrics()
+        self.assertIn('outbound_request_duration_seconds_count{upstream="stub-metrics"} 1', metrics)
+        self.assertIn('outbound_request_duration_seconds_bucket{upstream="stub-metrics",le="+Inf"} 1', metrics)
+        self.assertIn('outbound_circuit_open{upstream="stub-metrics"} 0', metrics)
+
+        self.assertEqual(self.client.get("/store/admin/metrics/upstreams/").status_code, 302)
+        self.client.force_login(User.objects.create_user("staff", password="pw", is_staff=True))
+        response = self.client.get("/store/admin/metrics/upstreams/")
+        self.assertEqual(response.content.decode(), outbound.render_metrics())
+
+    def test_sdks_use_shared_sessions(self):
+        self.assertIs(stripe.default_http_client._session, outbound.session("stripe"))
+        self.assertEqual(outbound.session("clerk").timeout, (2, 5))
+
+    def test_shippo_sdk_calls_get_the_policy(self):
+        session = self.upstream(retries=1, read_timeout=0.2)
+        shippo_sdk = Shippo(api_key_header="shippo_test", server_url=self.url.rsplit("/v1", 1)[0], client=session)
+        self.server.script = [(503, 0)]
+        try:
+            shippo_sdk.rates.get("rate_1")
+        except Exception:
+            pass  # the stub's body isn't a Rate; only the transport matters here
+        self.assertEqual(self.server.hits, 2)
+        self.assertEqual(session.latency.snapshot()[1], 2)
+
+        self.server.script = [(200, 0.5), (200, 0.5)]
+        started = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            shippo_sdk.rates.get("rate_1")
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_stripe_retries_in_one_layer(self):
+        self.assertEqual(stripe.max_network_retries, 0)
+        client = stripe.RequestsClient(session=self.upstream(retries=2))
+        self.server.script = [(503, 0)] * 9
+        with patch.object(stripe, "default_http_client", client), \
+                patch.object(stripe, "api_base", self.url.rsplit("/v1", 1)[0]):
+            with self.assertRaises(stripe.error.APIError):
+                stripe.checkout.Session.retrieve("cs_test_1", api_key="sk_test")
+        self.assertEqual(self.server.hits, 3)
+
+    def test_clerk_jwks_fetched_once_through_shared_session(self):
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+        jwks = {"keys": [{**jwk, "kid": "clerk-1", "use": "sig", "alg": "RS256"}]}
+        token = jwt.encode({"sub": "user_1"}, private_key, algorithm="RS256", headers={"kid": "clerk-1"})
+        request = RequestFactory().get("/store/orders/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        with patch("backend.clerk_auth._jwks", None), \
+                patch("backend.clerk_auth.outbound.session") as session:
+            session.return_value.get.return_value.json.return_value = jwks
+            for _ in range(3):
+                user, _ = ClerkAuthentication().authenticate(request)
+            self.assertEqual(user.username, "user_1")
+            session.assert_called_with("clerk")
+            self.assertEqual(session.return_value.get.call_count, 1)
+
+            other = jwt.encode({"sub": "user_2"}, private_key, algorithm="RS256", headers={"kid": "rotated"})
+            with self.assertRaises(AuthenticationFailed):
+                ClerkAuthentication().authenticate(RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {other}"))
+            self.assertEqual(session.return_value.get.call_count, 2)
+
+
+@override_settings(STORE_OWNER_EMAIL="owner@example.com", JOB_MAX_ATTEMPTS=2)
+class JobQueueTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.variant = make_product(self.category, name="Ring", sizes=("7",), stock=3).variants.get()
+
+    def post_event(self, event_id="evt_1"):
+        event = {"id": event_id, "type": "checkout.session.completed", "data": {"object": {
+            "id": "cs_test_1", "payment_status": "paid", "customer_email": "a@example.com",
+            "metadata": {"clerk_user_id": "user_1", "is_guest": "False", "reservation": ""},
+        }}}
+        with patch("store.views.webhooks.stripe.Webhook.construct_event", return_value=event):
+            return self.client.post("/store/stripe-webhook/", b"{}", content_type="application/json")
+
+    def work(self, *line_items):
+        line = type("Line", (), {"description": "Ring - 7", "quantity": 2, "amount_total": 5000})
+        with patch("store.fulfillment.stripe.checkout.Session.list_line_items", side_effect=line_items or None) as list_line_items:
+            list_line_items.return_value.data = [line]
+            out = io.StringIO()
+            call_command("run_worker", "--once", stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_webhook_only_enqueues(self):
+        with patch("store.fulfillment.stripe.checkout.Session.list_line_items") as list_line_items:
+            self.assertEqual(self.post_event().status_code, 200)
+            self.assertEqual(self.post_event().status_code, 200)  # redelivery
+        list_line_items.assert_not_called()
+        self.assertFalse(Order.objects.exists())
+        job = Job.objects.get()
+        self.assertEqual((job.kind, job.key, job.status), ("stripe.checkout.session.completed", "evt_1", Job.QUEUED))
+
+        out = self.work()
+        self.assertIn("Ran 3 jobs", out)
+        self.assertEqual(Order.objects.get().items.get().quantity, 2)
+        self.assertEqual(ProductVariant.objects.get(pk=self.variant.pk).stock, 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["a@example.com", "owner@example.com"])
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+    def test_failure_retries_with_backoff_then_dies(self):
+        self.post_event()
+        out = self.work(requests.ConnectionError("stripe down"))
+        self.assertIn("1 to retry", out)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn("stripe down", job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertFalse(Order.objects.exists())
+
+        self.assertIn("Ran 0 jobs", self.work())  # not due yet
+        Job.objects.update(run_at=timezone.now())
+        self.assertIn("1 dead", self.work(requests.ConnectionError("stripe down")))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DEAD, 2))
+
+        self.assertEqual(jobs.requeue(Job.objects.filter(status=Job.DEAD)), 1)
+        self.work()
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(ProductVariant.objects.get(pk=self.variant.pk).stock, 1)
+
+    def test_rerun_after_commit_is_a_no_op(self):
+        self.post_event()
+        self.work()
+        Job.objects.filter(kind="stripe.checkout.session.completed").update(status=Job.QUEUED, run_at=timezone.now())
+        self.work()
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(ProductVariant.objects.get(pk=self.variant.pk).stock, 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_expired_lease_is_claimed_again(self):
+        job = jobs.enqueue("test.noop", {})
+        self.assertEqual(jobs.claim(), [job])
+        self.assertEqual(jobs.claim(), [])
+        later = timezone.now() + timedelta(seconds=settings.JOB_LEASE_SECONDS + 1)
+        reclaimed = jobs.claim(now=later)
+        self.assertEqual([(claimed.pk, claimed.attempts) for claimed in reclaimed], [(job.pk, 2)])
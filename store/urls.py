@@ -6,6 +6,9 @@ from store.views.orders import OrderViewSet, StripeCheckoutView
 from store.views.webhooks import stripe_webhook, clerk_user_created_webhook
 from store.views.users import UserProfileView
 from store.views.shipping import preview_rates_view, generate_label_view
+from store.views.exports import export_products_view, export_orders_view
+from store.views.stock import StockView
+from store.views.metrics import upstream_metrics_view
 
 
 
@@ -22,10 +25,14 @@ urlpatterns = [
     path('create-checkout-session/', StripeCheckoutView.as_view(), name = 'stripe_checkout'),
     path('stripe-webhook/', stripe_webhook),
     path("clean-cart-stock/", CleanCartStockView.as_view(), name="clean_cart_stock"),
+    path("stock/", StockView.as_view(), name="stock"),
     path("clerk-user-created/", clerk_user_created_webhook,),
     path("user-profile/<str:clerk_user_id>/", UserProfileView.as_view(), name="user_profile_get"),
     path("user-profile/", UserProfileView.as_view(), name="user_profile_post"),
     path("admin/order/<int:order_id>/rates/", preview_rates_view, name="preview_rates"),
     path("admin/order/<int:order_id>/generate-label/", generate_label_view, name="generate_label"),
+    path("admin/export/products/", export_products_view, name="export_products"),
+    path("admin/export/orders/", export_orders_view, name="export_orders"),
+    path("admin/metrics/upstreams/", upstream_metrics_view, name="upstream_metrics"),
 
 ]
\ No newline at end of file
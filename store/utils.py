@@ -1,9 +1,10 @@
 # utils.py or wherever makes sense
 from shippo import Shippo, components
 from django.conf import settings
+from backend import outbound
 
 def fetch_rates_for_order(order, length, width, height, weight):
-    shippo_sdk = Shippo(api_key_header=settings.SHIPPO_API_KEY)
+    shippo_sdk = Shippo(api_key_header=settings.SHIPPO_API_KEY, client=outbound.session("shippo"))
 
     address = order.shipping_address or {}
 
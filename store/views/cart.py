@@ -1,10 +1,17 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Least
 from rest_framework import viewsets, serializers, status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound
 from rest_framework.permissions import AllowAny
-from store.models import Cart, CartItem
-from store.serializers import CartSerializer, CartItemSerializer, CartItemCreateSerializer
+from store.carts import add_to_cart, guest_cart_id, touch_cart, upsert_cart
+from store.models import Cart, CartItem, ProductVariant
+from store.serializers import CartSerializer, CartItemSerializer, CartItemCreateSerializer, CartBatchSerializer
+from store.pagination import CartItemCursorPagination
+from store.fast_serializers import cart_item_reader
 
 
 class CartViewSet(viewsets.ModelViewSet):
@@ -14,7 +21,9 @@ class CartViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user_id = self.request.query_params.get('clerk_user_id')
         if user_id:
-            return Cart.objects.filter(clerk_user_id=user_id)
+            return Cart.objects.filter(clerk_user_id=user_id).prefetch_related(
+                Prefetch('items', queryset=CartItem.objects.with_products())
+            )
         return Cart.objects.none()
     
     def get_serializer_context(self):
@@ -25,23 +34,29 @@ class CartViewSet(viewsets.ModelViewSet):
 class CartItemViewSet(viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
     permission_classes = [AllowAny]  # Temporarily allow any access for testing
+    pagination_class = CartItemCursorPagination
 
     def get_queryset(self):
-        user_id = (
-            self.request.query_params.get('clerk_user_id')
-            or getattr(self.request, 'clerk_user_id', None)
-    )
+        user_id = self.get_cart_owner(self.request.query_params.get('clerk_user_id'))
+        return CartItem.objects.filter(cart__clerk_user_id=user_id).with_products()
 
+    def get_cart_owner(self, user_id=None):
+        user_id = user_id or getattr(self.request, 'clerk_user_id', None)
         if not user_id:
             session_key = self.request.session.session_key or self.request.session.save() or self.request.session.session_key
-            user_id = f"guest_{session_key}"
-
-        return CartItem.objects.filter(cart__clerk_user_id=user_id)
+            user_id = guest_cart_id(session_key)
+        return user_id
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
+
+    def list(self, request, *args, **kwargs):
+        # Same payload as CartItemSerializer, built from rows by the compiled reader.
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(cart_item_reader.values(queryset))
+        return self.get_paginated_response(cart_item_reader.serialize(page, request))
     
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PUT', 'PATCH']:
@@ -49,35 +64,93 @@ class CartItemViewSet(viewsets.ModelViewSet):
         return CartItemSerializer
 
     def perform_create(self, serializer):
-        user_id = (
-            self.request.data.get("clerk_user_id")
-            or getattr(self.request, "clerk_user_id", None)
-    )
-
-        if not user_id:
-            session_key = self.request.session.session_key or self.request.session.save() or self.request.session.session_key
-            user_id = f"guest_{session_key}"
-
-        user_cart, _ = Cart.objects.get_or_create(clerk_user_id=user_id)
-
-    # Now safe to access validated data
+        user_id = self.get_cart_owner(self.request.data.get("clerk_user_id"))
         variant = serializer.validated_data['variant']
         quantity = serializer.validated_data['quantity']
-
-    # Check for existing cart item
-        existing_item = CartItem.objects.filter(cart=user_cart, variant=variant).first()
-        if existing_item:
-            new_total_quantity = existing_item.quantity + quantity
-            if new_total_quantity > variant.stock:
-                raise serializers.ValidationError("Cannot add more than available stock.")
-            existing_item.quantity = new_total_quantity
-            existing_item.save()
-            return
-
         if quantity > variant.stock:
             raise serializers.ValidationError("Not enough stock available.")
 
-        serializer.save(cart=user_cart)
+        user_cart = upsert_cart(user_id)
+        if not add_to_cart(user_cart.pk, variant, quantity):
+            raise serializers.ValidationError("Cannot add more than available stock.")
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Apply many {variant, quantity, op} lines to the cart at once.
+
+        `op` is "add" (the default), "set" or "remove"; setting 0 also
+        removes. Stock for every line is checked with one in_bulk() query
+        and the whole batch is written in a single transaction, so either
+        every line applies or none does. Responds with the updated cart.
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = serializer.validated_data['items']
+        user_id = self.get_cart_owner(serializer.validated_data.get('clerk_user_id'))
+
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    cart = self.apply_batch(user_id, lines)
+                break
+            except IntegrityError:
+                # A concurrent add inserted one of this batch's new lines
+                # first. Rerun the batch: it now finds and locks that line.
+                if attempt:
+                    raise
+
+        cart = Cart.objects.prefetch_related(
+            Prefetch('items', queryset=CartItem.objects.with_products())
+        ).get(pk=cart.pk)
+        return Response(CartSerializer(cart, context=self.get_serializer_context()).data)
+
+    def apply_batch(self, user_id, lines):
+        """Write a validated batch to the user's cart; call inside a transaction."""
+        cart = upsert_cart(user_id)
+        variant_ids = {line['variant'] for line in lines}
+        variants = ProductVariant.objects.only('id', 'stock').in_bulk(variant_ids)
+        items = {
+            item.variant_id: item
+            for item in cart.items.select_for_update().filter(variant_id__in=variant_ids)
+        }
+
+        quantities = {variant_id: item.quantity for variant_id, item in items.items()}
+        errors = [{} for _ in lines]
+        for line, error in zip(lines, errors):
+            variant = variants.get(line['variant'])
+            if variant is None:
+                error['variant'] = ["Invalid variant."]
+                continue
+            if line['op'] == 'add':
+                quantity = quantities.get(variant.id, 0) + line['quantity']
+            elif line['op'] == 'set':
+                quantity = line['quantity']
+            else:
+                quantity = 0
+            if quantity > variant.stock:
+                error['quantity'] = ["Not enough stock available."]
+                continue
+            quantities[variant.id] = quantity
+        if any(errors):
+            raise serializers.ValidationError({'items': errors})
+
+        created, updated, removed = [], [], []
+        for variant_id, quantity in quantities.items():
+            item = items.get(variant_id)
+            if item is None:
+                if quantity:
+                    created.append(CartItem(cart=cart, variant_id=variant_id, quantity=quantity))
+            elif not quantity:
+                removed.append(item.pk)
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                updated.append(item)
+        CartItem.objects.bulk_create(created)
+        CartItem.objects.bulk_update(updated, ['quantity'])
+        if removed:
+            CartItem.objects.filter(pk__in=removed).delete()
+        return cart
 
     def get_object(self):
         queryset = self.filter_queryset(self.get_queryset())
@@ -95,9 +168,11 @@ class CartItemViewSet(viewsets.ModelViewSet):
         if quantity > item.variant.stock:
             raise serializers.ValidationError("Not enough stock available.")
         serializer.save()
+        touch_cart(item.cart_id)
 
     def perform_destroy(self, instance):
         instance.delete()
+        touch_cart(instance.cart_id)
 
 class CleanCartStockView(APIView):
     permission_classes = [AllowAny]
@@ -114,27 +189,40 @@ class CleanCartStockView(APIView):
         except Cart.DoesNotExist:
             return Response({"error": "Cart not found"}, status=404)
 
-        updated_items = []
-        removed_items = []
-
-        for item in cart.items.all():
-            variant = item.variant
-            product = variant.product
-            if variant.stock == 0:
+        # One joined read of just the lines that need attention, then one
+        # statement each to drop sold-out lines and clamp the rest to stock.
+        stale = list(
+            cart.items.filter(Q(variant__stock=0) | Q(quantity__gt=F('variant__stock')))
+            .order_by('id')
+            .values('id', 'variant__stock', 'variant__product__name')
+        )
+        removed_ids, adjusted_ids = [], []
+        removed_items, updated_items = [], []
+        for row in stale:
+            product_name = row['variant__product__name']
+            if row['variant__stock'] == 0:
+                removed_ids.append(row['id'])
                 removed_items.append({
-                    "product": product.name,
+                    "product": product_name,
                     "reason": "out_of_stock"
                 })
-                item.delete()
-            elif item.quantity > variant.stock:
-                item.quantity = variant.stock
-                item.save()
+            else:
+                adjusted_ids.append(row['id'])
                 updated_items.append({
-                    "product": product.name,
-                    "adjusted_to": variant.stock,
+                    "product": product_name,
+                    "adjusted_to": row['variant__stock'],
                     "reason": "reduced_to_match_stock"
                 })
 
+        with transaction.atomic():
+            if removed_ids:
+                CartItem.objects.filter(id__in=removed_ids).delete()
+            if adjusted_ids:
+                stock = ProductVariant.objects.filter(pk=OuterRef('variant_id')).values('stock')[:1]
+                CartItem.objects.filter(id__in=adjusted_ids).update(quantity=Least('quantity', Subquery(stock)))
+            if stale:
+                touch_cart(cart.pk)
+
         return Response({
             "removed": removed_items,
             "adjusted": updated_items,
@@ -0,0 +1,127 @@
+import csv
+from datetime import datetime, time
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from backend.renderers import FastJSONRenderer
+from store.models import Order, ProductVariant
+
+CHUNK_SIZE = 2000
+
+PRODUCT_COLUMNS = {
+    'variant_id': 'id',
+    'product_id': 'product_id',
+    'sku': 'product__sku',
+    'name': 'product__name',
+    'category': 'product__category__slug',
+    'price': 'product__price',
+    'size': 'size',
+    'stock': 'stock',
+    'created_at': 'product__created_at',
+    'updated_at': 'updated_at',
+}
+
+ORDER_COLUMNS = {
+    'order_id': 'id',
+    'created_at': 'created_at',
+    'email': 'email',
+    'clerk_user_id': 'clerk_user_id',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'payment_status': 'stripe_payment_status',
+    'subtotal': 'subtotal',
+    'shipping_cost': 'shipping_cost',
+    'is_shipped': 'is_shipped',
+    'tracking_number': 'tracking_number',
+    'item_id': 'items__id',
+    'variant_id': 'items__variant_id',
+    'product_name': 'items__variant__product__name',
+    'size': 'items__variant__size',
+    'quantity': 'items__quantity',
+    'unit_price': 'items__price',
+}
+
+
+class Echo:
+    """An object that implements just the write method of the file-like interface."""
+
+    def write(self, value):
+        return value
+
+
+def _parse_bound(value, end_of_day=False):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _date_range(request, queryset, field):
+    since, until = request.GET.get('since'), request.GET.get('until')
+    if since:
+        queryset = queryset.filter(**{f'{field}__gte': _parse_bound(since)})
+    if until:
+        queryset = queryset.filter(**{f'{field}__lte': _parse_bound(until, end_of_day=True)})
+    return queryset
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _stream(queryset, columns, export_format, filename):
+    # values() + iterator() keeps one chunk of rows in memory at a time
+    # (a server-side cursor on PostgreSQL), however large the table.
+    rows = queryset.values_list(*columns.values()).iterator(chunk_size=CHUNK_SIZE)
+    names = list(columns)
+
+    if export_format == 'csv':
+        content = _csv_lines(names, rows)
+        content_type = 'text/csv'
+    else:
+        renderer = FastJSONRenderer()
+        content = (renderer.render(dict(zip(names, row))) + b'\n' for row in rows)
+        content_type = 'application/x-ndjson'
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+def _csv_lines(names, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def _export(request, queryset, date_field, columns, filename):
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return JsonResponse({"error": "format must be ndjson or csv"}, status=400)
+    try:
+        queryset = _date_range(request, queryset, date_field)
+    except ValueError as e:
+        return JsonResponse({"error": f"Invalid date: {e}"}, status=400)
+    return _stream(queryset, columns, export_format, filename)
+
+
+@staff_member_required
+def export_products_view(request):
+    """One row per variant; ?since=/?until= filter on the variant's last change."""
+    queryset = ProductVariant.objects.order_by('product_id', 'id')
+    return _export(request, queryset, 'updated_at', PRODUCT_COLUMNS, 'products')
+
+
+@staff_member_required
+def export_orders_view(request):
+    """One row per order item (orders without items get one row); ?since=/?until= filter on order date."""
+    queryset = Order.objects.order_by('id', 'items__id')
+    return _export(request, queryset, 'created_at', ORDER_COLUMNS, 'orders')
@@ -0,0 +1,9 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
+from backend import outbound
+
+
+@staff_member_required
+def upstream_metrics_view(request):
+    """Outbound HTTP latency histograms and circuit states, for a Prometheus scrape."""
+    return HttpResponse(outbound.render_metrics(), content_type="text/plain; version=0.0.4")
@@ -3,9 +3,17 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.conf import settings
-from store.models import Order, ProductVariant, Product
+from django.db.models import Prefetch
+from backend.clerk_auth import ClerkAuthentication
+from store import catalog, reservations
+from store.idempotency import HEADER as IDEMPOTENCY_HEADER, idempotent
+from store.models import Order, OrderItem, ProductVariant
 from store.serializers import OrderSerializer
+from store.pagination import OrderCursorPagination
+from store.fast_serializers import order_reader
+from decimal import Decimal
 import json
+import uuid
 import stripe
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
@@ -14,63 +22,80 @@ stripe.api_key = settings.STRIPE_SECRET_KEY
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
-        return Order.objects.filter(clerk_user_id=self.request.clerk_user_id)
+        return Order.objects.filter(clerk_user_id=self.request.clerk_user_id).prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.with_products())
+        )
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
 
+    def list(self, request, *args, **kwargs):
+        # Same payload as OrderSerializer, built from rows by the compiled reader.
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(order_reader.values(queryset))
+        return self.get_paginated_response(order_reader.serialize(page, request))
+
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 class StripeCheckoutView(APIView):
     permission_classes = [AllowAny]
 
+    @idempotent('checkout')
     def post(self, request):
         data = request.data
         line_items = []
-        subtotal = 0
+        subtotal = Decimal('0.00')
         out_of_stock_items = []
 
         clerk_user_id = request.data.get('clerk_user_id', "")
         is_guest = clerk_user_id.startswith("guest_")
 
-        for item in data['items']:
-            try:
-                variant = ProductVariant.objects.select_related('product').get(id=item['variant'])
-                quantity = int(item['quantity'])
-                product = variant.product
-                price = float(product.price)
-
-                if variant.stock < quantity:
-                    out_of_stock_items.append({
-                        "product": product.name,
-                        "variant": variant.size,
-                        "requested": quantity,
-                        "available": variant.stock
-                    })
-                    continue
-
-                subtotal += quantity * price
-
-                line_items.append({
-                    'price_data': {
-                        'currency': 'usd',
-                        'unit_amount': int(price * 100),
-                        'product_data': {
-                            'name': f"{product.name} - {variant.size or 'Default'}",
-                            'description': product.description,
-                            'images': [request.build_absolute_uri(product.image.url)] if product.image else [],
-                        },
-                    },
-                    'quantity': quantity,
+        # A client Idempotency-Key fixes the hold's reference, so a retry
+        # reuses the first attempt's hold and sends Stripe identical
+        # parameters under the same key.
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        reference = uuid.uuid5(uuid.NAMESPACE_URL, f"checkout:{idempotency_key}") if idempotency_key else None
+        # Only a verified Clerk token says whose earlier holds these are;
+        # the clerk_user_id in the body or query string is anyone's to send.
+        # Released first, so the stock read below counts their units.
+        owner = request.clerk_user_id if isinstance(request.successful_authenticator, ClerkAuthentication) else ""
+        if owner:
+            self.release_earlier_holds(owner, reference)
+
+        # Stock and prices come from one in_bulk() read; the product_data
+        # blocks for Stripe are prebuilt per variant in the catalog cache.
+        requested = [(int(item['variant']), int(item['quantity'])) for item in data['items']]
+        variant_ids = {variant_id for variant_id, _ in requested}
+        variants = ProductVariant.objects.select_related('product').in_bulk(variant_ids)
+        if len(variants) < len(variant_ids):
+            return Response({'error': 'Product not found'}, status=400)
+        prices = catalog.get_price_data(list(variants.values()))
+
+        for variant_id, quantity in requested:
+            variant = variants[variant_id]
+            product = variant.product
+
+            if variant.stock < quantity:
+                out_of_stock_items.append({
+                    "product": product.name,
+                    "variant": variant.size,
+                    "requested": quantity,
+                    "available": variant.stock
                 })
-                
-            except Product.DoesNotExist:
-                return Response({'error': 'Product not found'}, status=400)
+                continue
+
+            subtotal += quantity * product.price
+
+            line_items.append({
+                'price_data': prices[variant_id],
+                'quantity': quantity,
+            })
 
         if out_of_stock_items:
             return Response({
@@ -78,8 +103,60 @@ class StripeCheckoutView(APIView):
                 "details": out_of_stock_items
             }, status=400)
 
-        # Create Stripe Checkout Session with all needed metadata
-        session = stripe.checkout.Session.create(
+        # Take the units off sale until the session is paid or expires.
+        try:
+            hold = reservations.reserve(
+                ((variants[variant_id], quantity) for variant_id, quantity in requested),
+                owner=owner,
+                reference=reference,
+            )
+        except reservations.InsufficientStock as short:
+            return Response({
+                "error": "items are out of stock",
+                "details": [
+                    {
+                        "product": variants[variant_id].product.name,
+                        "variant": variants[variant_id].size,
+                        "requested": sum(quantity for pk, quantity in requested if pk == variant_id),
+                        "available": available,
+                    }
+                    for variant_id, available in short.available.items()
+                ]
+            }, status=400)
+
+        try:
+            session = self.create_session(data, line_items, clerk_user_id, is_guest, hold)
+        except Exception:
+            # A keyed call may still have reached Stripe (e.g. a timeout), so
+            # its hold stays for the retry; release_expired() collects it if
+            # none comes.
+            if not idempotency_key:
+                reservations.release(hold.reference)
+            raise
+        reservations.attach_session(hold.reference, session.id)
+
+        return Response({'checkout_url': session.url})
+
+    def release_earlier_holds(self, owner, keep):
+        # A buyer who abandons a Stripe page and checks out again shouldn't
+        # compete with their own hold. Its units only go back on sale once
+        # Stripe has expired the old session, though: a released hold whose
+        # session can still be paid would oversell.
+        for reference, session_id in reservations.held_by(owner, exclude=keep).items():
+            if not session_id:
+                continue  # session still being created; expiry releases it
+            try:
+                stripe.checkout.Session.expire(session_id)
+            except stripe.error.StripeError:
+                continue  # paid meanwhile, or Stripe unreachable; the webhook or sweeper ends it
+            reservations.release(reference)
+
+    def create_session(self, data, line_items, clerk_user_id, is_guest, hold):
+        # Create Stripe Checkout Session with all needed metadata.
+        # A client Idempotency-Key also dedupes the call on Stripe's side.
+        idempotency_key = self.request.headers.get(IDEMPOTENCY_HEADER)
+        return stripe.checkout.Session.create(
+            idempotency_key=f"checkout-{idempotency_key}" if idempotency_key else None,
             payment_method_types=['card'],
             customer_email=data.get('email', ''),
             line_items=line_items,
@@ -97,6 +174,7 @@ class StripeCheckoutView(APIView):
             }
         }
     ],
+            expires_at=int(hold.expires_at.timestamp()),
             success_url='https://www.buddhabashajewelry.com/success',
             cancel_url='https://www.buddhabashajewelry.com/cancel',
             metadata={
@@ -107,9 +185,8 @@ class StripeCheckoutView(APIView):
                 'shipping_cost': "5.00",
                 'first_name': data.get('first_name', ''),
                 'last_name': data.get('last_name', ''),
+                'reservation': str(hold.reference),
             },
             client_reference_id=str(clerk_user_id or 'guest')
         )
-
-        return Response({'checkout_url': session.url})
    
\ No newline at end of file
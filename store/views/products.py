@@ -1,20 +1,129 @@
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from store import catalog
 from store.models import Product, Category
-from store.serializers import ProductSerializer, CategorySerializer
+from store.serializers import ProductSerializer, ProductCardSerializer, CategorySerializer
+from store.pagination import ProductCursorPagination
+from store.search import search_product_ids
+from store.filters import ProductFilterBackend, product_facets
 
+# Repeat visitors get a 304 from the cached catalog state alone, before any
+# query or serializer runs. The ETag depends on the Accept header, and so
+# must every cache holding these responses.
+catalog_conditional = method_decorator([
+    vary_on_headers('Accept'),
+    condition(etag_func=catalog.catalog_etag, last_modified_func=catalog.catalog_last_modified),
+])
+catalog_etag_conditional = method_decorator([
+    vary_on_headers('Accept'),
+    condition(etag_func=catalog.catalog_etag),
+])
 
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+    queryset = Product.objects.for_catalog()
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    pagination_class = ProductCursorPagination
+    filter_backends = [ProductFilterBackend]
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
 
+    def get_projection(self):
+        """
+        Resolve ?view=card, ?fields= and ?omit= into a trimmed queryset and
+        serializer, or None when the full representation is wanted.
+        """
+        params = self.request.query_params
+        view = params.get('view')
+        if view == 'card':
+            return Product.objects.for_card(), ProductCardSerializer, {}
+        if view:
+            raise ValidationError({'view': f"Unknown view '{view}'."})
+
+        fields, omit = params.get('fields'), params.get('omit')
+        if not fields and not omit:
+            return None
+        available = list(ProductSerializer().fields)
+        requested = [name for name in fields.split(',') if name] if fields else available
+        omitted = {name for name in omit.split(',') if name} if omit else set()
+        unknown = (set(requested) | omitted) - set(available)
+        if unknown:
+            raise ValidationError({'fields': f"Unknown field(s): {', '.join(sorted(unknown))}."})
+        selected = [name for name in requested if name not in omitted]
+        return Product.objects.for_fields(selected), ProductSerializer, {'fields': selected}
+
+    @catalog_conditional
+    def list(self, request, *args, **kwargs):
+        projection = self.get_projection()
+        if projection is not None:
+            queryset, serializer_class, serializer_kwargs = projection
+            page = self.paginate_queryset(self.filter_queryset(queryset))
+            serializer = serializer_class(page, many=True, context=self.get_serializer_context(), **serializer_kwargs)
+            return self.get_paginated_response(serializer.data)
+
+        # Only the page keys come from the database; product bodies are
+        # served from the pre-serialized catalog snapshot.
+        queryset = self.filter_queryset(Product.objects.only('id', 'created_at'))
+        page = self.paginate_queryset(queryset)
+        ids = [product.id for product in page]
+        rendered = catalog.get_products_json(ids)
+        body = self.paginator.get_paginated_bytes(rendered[pk] for pk in ids if pk in rendered)
+        return HttpResponse(body, content_type='application/json')
+
+    @catalog_conditional
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise NotFound()
+
+        projection = self.get_projection()
+        if projection is not None:
+            queryset, serializer_class, serializer_kwargs = projection
+            product = queryset.filter(pk=pk).first()
+            if product is None:
+                raise NotFound()
+            return Response(serializer_class(product, context=self.get_serializer_context(), **serializer_kwargs).data)
+
+        body = catalog.get_products_json([pk]).get(pk)
+        if body is None:
+            raise NotFound()
+        return HttpResponse(body, content_type='application/json')
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 20
+        ids = search_product_ids(request.query_params.get('q', ''), limit=limit)
+        rendered = catalog.get_products_json(ids)
+        body = b'{"results":[' + b','.join(rendered[pk] for pk in ids if pk in rendered) + b']}'
+        return HttpResponse(body, content_type='application/json')
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        return Response(product_facets(self.filter_queryset(Product.objects.all())))
+
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
+
+    @catalog_etag_conditional
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @catalog_etag_conditional
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
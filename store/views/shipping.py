@@ -1,6 +1,7 @@
 from shippo import Shippo
 from shippo.models import components
 from django.conf import settings
+from backend import outbound
 from django.utils import timezone
 from django.template.loader import render_to_string
 from django.core.mail import EmailMessage
@@ -58,7 +59,7 @@ def generate_label_view(request, order_id):
             messages.error(request, "❌ Missing shipment or rate ID.")
             return redirect(f"/admin/store/order/{order.id}/change/")
 
-        shippo_sdk = Shippo(api_key_header=settings.SHIPPO_API_KEY)
+        shippo_sdk = Shippo(api_key_header=settings.SHIPPO_API_KEY, client=outbound.session("shippo"))
 
         try:
             shipment = shippo_sdk.shipments.get(order.shippo_shipment_id)
@@ -0,0 +1,32 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import AllowAny
+from store.catalog import get_stock_levels
+
+MAX_IDS = 200
+
+
+class StockView(APIView):
+    """
+    Stock for many variants in one round trip: GET ?ids=1,2,3 or POST {"ids": [1, 2, 3]}.
+    Unknown ids are left out of the response.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []  # public data; skip the Clerk JWKS lookup
+
+    def get(self, request):
+        return self.respond(request.query_params.get('ids', '').split(','))
+
+    def post(self, request):
+        ids = request.data.get('ids', []) if isinstance(request.data, dict) else []
+        return self.respond(ids if isinstance(ids, list) else [])
+
+    def respond(self, raw_ids):
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in raw_ids if str(pk).strip()))
+        except (TypeError, ValueError):
+            return Response({"error": "ids must be integers"}, status=400)
+        if len(ids) > MAX_IDS:
+            return Response({"error": f"At most {MAX_IDS} ids per request"}, status=400)
+        levels = get_stock_levels(ids)
+        return Response({str(pk): levels[pk] for pk in ids if pk in levels})